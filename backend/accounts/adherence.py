@@ -0,0 +1,171 @@
+from accounts.dose_bitmap import is_slot_taken, load_bitmaps
+from accounts.models import Prescription, TakenDose, ArchivedPrescription, ArchivedTakenDose
+from accounts.retention import reminder_counts
+from accounts.schedule import compile_schedule, parse_medicine
+from collections import defaultdict
+from datetime import datetime, timedelta, time as dt_time
+from django.db.models import Q
+from django.utils import timezone
+
+OUTCOMES = ('taken', 'late', 'missed')
+
+
+def _rates(counts):
+    scheduled = counts['scheduled']
+    row = dict(counts)
+    for outcome in OUTCOMES:
+        row[f'{outcome}_pct'] = round(100.0 * counts[outcome] / scheduled, 1) if scheduled else None
+    return row
+
+
+def classify_slots(slots, confirmed, window, unslotted_times=()):
+    """
+    Classify sorted slot times as 'taken', 'late' or 'missed'.
+
+    `confirmed` maps each slot recorded as taken to when the patient confirmed it (None when
+    only the dose bitmap knows it was taken). A confirmed slot is 'late' if the confirmation
+    came more than `window` after it, otherwise 'taken' (upcoming doses may be confirmed early).
+
+    `unslotted_times` are sorted confirmation times of doses recorded before their slot was
+    stored with them. They are matched to the remaining slots in a single merge pass: a slot
+    is 'taken' when such a dose falls within ±window of it, 'late' when the first unused dose
+    after that comes before the next slot's window opens. Each dose is consumed at most once.
+    """
+    outcomes = []
+    i = 0
+    for n, slot in enumerate(slots):
+        # doses before this slot's window were extras (e.g. an as-needed top-up); skip them
+        while i < len(unslotted_times) and unslotted_times[i] < slot - window:
+            i += 1
+        if slot in confirmed:
+            # an unslotted dose inside the window is this same confirmation (the bitmap backfill)
+            if i < len(unslotted_times) and unslotted_times[i] <= slot + window:
+                i += 1
+            taken_at = confirmed[slot]
+            outcomes.append('late' if taken_at is not None and taken_at > slot + window else 'taken')
+            continue
+        upper = slots[n + 1] - window if n + 1 < len(slots) else None
+        if i < len(unslotted_times) and unslotted_times[i] <= slot + window:
+            outcomes.append('taken')
+            i += 1
+        elif i < len(unslotted_times) and (upper is None or unslotted_times[i] < upper):
+            outcomes.append('late')
+            i += 1
+        else:
+            outcomes.append('missed')
+    return outcomes
+
+
+def _index_doses(rows):
+    """
+    Split (prescription, medicine, scheduled_time, taken_at) rows into per-medicine
+    `{slot timestamp: taken_at}` and sorted confirmation times of doses with no recorded slot.
+    Slots are keyed by whole seconds, the precision of the log ids they were confirmed with.
+    """
+    confirmed = defaultdict(dict)
+    unslotted = defaultdict(list)
+    for prescription_id, medicine_name, scheduled_time, taken_at in rows:
+        if scheduled_time is None:
+            unslotted[(prescription_id, medicine_name)].append(taken_at)
+        else:
+            confirmed[(prescription_id, medicine_name)][int(scheduled_time.timestamp())] = taken_at
+    for times in unslotted.values():
+        times.sort()
+    return confirmed, unslotted
+
+
+def adherence_report(patient, start_date, end_date):
+    """
+    Taken / late / missed counts and percentages per medicine and per day for a patient.
+
+    Covers live and archived prescriptions. Slots are generated with the compiled schedule
+    engine; whether a slot was taken comes from the slot recorded with each dose (and, for
+    live prescriptions, the dose bitmaps), and lateness from when the dose was confirmed.
+    Doses and bitmaps are loaded in one query per table; slots whose detection window has
+    not closed yet are left out. `reminders` counts the SMS reminders sent per medicine in
+    the range.
+    """
+    now = timezone.now()
+    start = timezone.make_aware(datetime.combine(start_date, dt_time()))
+    end = min(timezone.make_aware(datetime.combine(end_date + timedelta(days=1), dt_time())), now)
+
+    live = list(
+        Prescription.objects.filter(patient=patient, created_at__lt=end)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=start))
+        .prefetch_related('medicine_items')
+    )
+    archived = list(
+        ArchivedPrescription.objects.filter(patient=patient, created_at__lt=end)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=start))
+    )
+
+    sources = []
+    for prescription in live:
+        for item in prescription.medicine_items.all():
+            schedule = item.schedule(prescription.created_at)
+            if schedule is not None:
+                sources.append((prescription.id, False, prescription.id, item.name, schedule))
+    for prescription in archived:
+        for medicine in prescription.medicines:
+            parsed = parse_medicine(medicine)
+            if not parsed['name'] or parsed['as_needed']:
+                continue
+            schedule = compile_schedule(
+                prescription.created_at, parsed['interval_minutes'], parsed['fixed_offsets'], parsed['duration_days'],
+            )
+            sources.append((prescription.original_id, True, prescription.id, parsed['name'], schedule))
+
+    # Doses without a recorded slot are matched with one period of context on either side
+    slack = max((schedule.period for *_, schedule in sources), default=timedelta(days=1))
+    dose_range = (
+        Q(scheduled_time__gte=start - 2 * slack, scheduled_time__lt=end + 2 * slack)
+        | Q(scheduled_time__isnull=True, taken_at__gte=start - 2 * slack, taken_at__lt=end + 2 * slack)
+    )
+    fields = ('prescription_id', 'medicine_name', 'scheduled_time', 'taken_at')
+    doses = {
+        False: _index_doses(TakenDose.objects.filter(dose_range, prescription__in=live).values_list(*fields)),
+        True: _index_doses(ArchivedTakenDose.objects.filter(dose_range, prescription__in=archived).values_list(*fields)),
+    }
+    bitmaps = load_bitmaps([prescription.id for prescription in live], start - slack, end + slack)
+
+    medicines = []
+    days = defaultdict(lambda: dict.fromkeys(('scheduled',) + OUTCOMES, 0))
+    totals = dict.fromkeys(('scheduled',) + OUTCOMES, 0)
+    for prescription_id, is_archived, row_id, name, schedule in sources:
+        window = timedelta(minutes=schedule.window_minutes)
+        # One slot of context on either side so doses near the edges are attributed correctly
+        slots = schedule.slots_between(start - schedule.period, end + schedule.period)
+        recorded, unslotted = doses[is_archived]
+        recorded = recorded.get((row_id, name), {})
+        confirmed = {}
+        for slot in slots:
+            timestamp = int(slot.timestamp())
+            if timestamp in recorded:
+                confirmed[slot] = recorded[timestamp]
+            elif not is_archived and is_slot_taken(bitmaps, row_id, name, slot):
+                confirmed[slot] = None
+        outcomes = classify_slots(slots, confirmed, window, unslotted.get((row_id, name), []))
+        counts = dict.fromkeys(('scheduled',) + OUTCOMES, 0)
+        for slot, outcome in zip(slots, outcomes):
+            if not (start <= slot and slot + window <= end):
+                continue
+            day = days[timezone.localtime(slot).date()]
+            for bucket in (counts, day, totals):
+                bucket['scheduled'] += 1
+                bucket[outcome] += 1
+        if counts['scheduled']:
+            medicines.append({
+                'prescription': prescription_id,
+                'archived': is_archived,
+                'medicine_name': name,
+                **_rates(counts),
+            })
+
+    return {
+        'start': start_date,
+        'end': end_date,
+        'totals': _rates(totals),
+        'medicines': medicines,
+        'days': [{'date': day, **_rates(counts)} for day, counts in sorted(days.items())],
+        'reminders': reminder_counts(patient, start_date, end_date),
+    }
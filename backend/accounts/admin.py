@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from .models import Profile, Doctor
+from .models import Profile, Doctor, JobRun
 
 
 class ProfileInline(admin.StackedInline):
@@ -62,7 +62,13 @@ class DoctorAdmin(UserAdmin):
             Profile.objects.create(user=obj, name=(obj.first_name + ' ' + obj.last_name).strip())
 
 
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'started_at', 'duration_ms', 'slots_evaluated', 'queries', 'sms_sent', 'sms_failed', 'error')
+    list_filter = ('job',)
+
+
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Doctor, DoctorAdmin)
 admin.site.register(Profile)
+admin.site.register(JobRun, JobRunAdmin)
@@ -1,18 +1,30 @@
 from django.apps import AppConfig
 from django.conf import settings
+import logging
 import sys
 import os
 
+logger = logging.getLogger('accounts.cron')
+
+# WSGI/ASGI servers the in-process scheduler runs under, by program and module name
+SERVER_NAMES = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi', 'mod_wsgi')
+
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
 
     def ready(self):
-        # Start the scheduler only once, avoiding double execution in dev mode
-        # RUN_MAIN is set by Django's autoreloader after the first startup
-        if os.environ.get('RUN_MAIN') == 'true' and 'runserver' in sys.argv:
-            from accounts import scheduler
-            scheduler.start()
+        # Start the scheduler in every server process; a DB lease (accounts.leader) makes sure
+        # only one of them actually runs the jobs. Under runserver, RUN_MAIN is set by the
+        # autoreloader in the child that serves requests, so the watcher process is skipped.
+        # Deployments with a dedicated `manage.py run_reminder_worker` turn this off.
+        if settings.MEDICATION_REMINDER_IN_PROCESS_SCHEDULER:
+            if self._is_server_process():
+                from accounts import scheduler
+                scheduler.start()
+            else:
+                program = sys.argv[0] if sys.argv else ''
+                logger.info(f"Not a server process ({program!r}); in-process reminder scheduler not started")
         
         # Set up WAL mode using connection_created signal (avoids RuntimeWarning)
         if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
@@ -26,3 +38,17 @@ class AccountsConfig(AppConfig):
                     cursor.close()
             
             connection_created.connect(enable_wal_mode)
+
+    @staticmethod
+    def _is_server_process():
+        if 'runserver' in sys.argv:
+            return os.environ.get('RUN_MAIN') == 'true'
+        program = sys.argv[0] if sys.argv else ''
+        if os.path.basename(program) == 'manage.py':
+            return False
+        # The program name, or its package for `python -m gunicorn` (…/gunicorn/__main__.py);
+        # uWSGI and mod_wsgi embed Python with an unrelated argv but expose their own module
+        launcher = os.path.basename(program)
+        if launcher == '__main__.py':
+            launcher = os.path.basename(os.path.dirname(program))
+        return any(launcher == name or name in sys.modules for name in SERVER_NAMES)
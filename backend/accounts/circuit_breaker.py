@@ -0,0 +1,158 @@
+"""
+Per-provider circuit breakers for the provider SMS backend.
+
+Each provider's breaker watches a rolling window of its recent calls. A call counts as a
+failure if it raised or took longer than the slow-call threshold. Once enough calls have
+been seen and the failure ratio reaches the threshold the breaker opens, and the backend
+skips that provider entirely (going straight to the fallback) for `open_seconds`. Then it
+lets a limited number of half-open probe calls through: a successful probe closes the
+breaker, a failed one opens it again.
+
+State lives in process memory, so every web/worker process keeps its own breakers.
+"""
+from collections import deque
+from django.conf import settings
+import logging
+import threading
+import time
+
+logger = logging.getLogger('accounts.cron')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised in place of a call that a provider's open breaker did not let through."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, slow_call_seconds=5.0,
+                 open_seconds=30.0, half_open_probes=1, clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True = failure
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes_in_flight = 0
+        # Lifetime counters, exposed as metrics
+        self._successes = 0
+        self._failures = 0
+        self._rejected = 0
+        self._trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    def allow_request(self):
+        """True if a call may go to this provider now (reserves a probe slot when half-open)."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def cancel_request(self):
+        """Give back a call `allow_request` let through that was never made (frees its probe slot)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    def record_success(self, duration):
+        if duration > self.slow_call_seconds:
+            self.record_failure(reason=f"slow call ({duration:.1f}s)")
+            return
+        with self._lock:
+            self._successes += 1
+            if self._state == HALF_OPEN:
+                logger.info(f"SMS circuit {self.name} closed after a successful probe")
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(False)
+
+    def record_failure(self, reason=None):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN:
+                self._open(f"probe failed: {reason}")
+                return
+            self._outcomes.append(True)
+            failed = sum(self._outcomes)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls \
+                    and failed / len(self._outcomes) >= self.failure_rate:
+                self._open(f"{failed}/{len(self._outcomes)} recent calls failed; last: {reason}")
+
+    def _open(self, why):
+        logger.warning(f"SMS circuit {self.name} opened ({why})")
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._probes_in_flight = 0
+        self._trips += 1
+
+    def snapshot(self):
+        """Current state and counters as a dict (for the health endpoint)."""
+        with self._lock:
+            state = self._current_state()
+            recent = len(self._outcomes)
+            return {
+                'provider': self.name,
+                'state': state,
+                'recent_calls': recent,
+                'recent_failure_rate': round(sum(self._outcomes) / recent, 3) if recent else None,
+                'retry_in_seconds': (
+                    round(max(0.0, self.open_seconds - (self._clock() - self._opened_at)), 1)
+                    if state == OPEN else None
+                ),
+                'successes': self._successes,
+                'failures': self._failures,
+                'rejected': self._rejected,
+                'trips': self._trips,
+            }
+
+
+_registry_lock = threading.Lock()
+_breakers = {}
+
+
+def get_breaker(provider):
+    """The process-wide breaker for `provider`, configured from the SMS_BREAKER_* settings."""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(provider)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    provider,
+                    window=settings.SMS_BREAKER_WINDOW,
+                    min_calls=settings.SMS_BREAKER_MIN_CALLS,
+                    failure_rate=settings.SMS_BREAKER_FAILURE_RATE,
+                    slow_call_seconds=settings.SMS_BREAKER_SLOW_CALL_SECONDS,
+                    open_seconds=settings.SMS_BREAKER_OPEN_SECONDS,
+                    half_open_probes=settings.SMS_BREAKER_HALF_OPEN_PROBES,
+                )
+                _breakers[provider] = breaker
+    return breaker
+
+
+def reset():
+    with _registry_lock:
+        _breakers.clear()
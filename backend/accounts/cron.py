@@ -1,154 +1,209 @@
-from accounts.models import TakenDose, Prescription, MedicationReminder
-from accounts.utils import send_sms
-from datetime import datetime, timedelta, time as dt_time
+from accounts.dose_bitmap import is_slot_taken, load_bitmaps
+from accounts.job_runs import record_job_run
+from accounts.models import MedicationReminder, DoseSlot, JobWatermark, ReminderOutbox
+from accounts.retention import archive_expired_prescriptions, compact_medication_reminders
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
 from django.utils import timezone
 import logging
 
 logger = logging.getLogger('accounts.cron')
 
+# Columns the reminder scan actually reads; everything else (medicines JSON, notes, ...) stays in the DB.
+SLOT_SCAN_FIELDS = (
+    'id',
+    'prescription_id',
+    'medicine_name',
+    'scheduled_time',
+    'prescription__patient__profile__phone_number',
+)
+
+
+def _iter_slot_batches(queryset, batch_size):
+    """
+    Yield lists of at most `batch_size` slots using keyset pagination on the primary key.
+
+    Each batch is its own short query, so memory stays flat and the status updates written
+    between batches never race an open cursor (SQLite gives no isolation for that).
+    """
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id')[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def _process_slot_batch(slots, run):
+    # Fetch the dose bitmaps and reminders covering these slots in two queries; whether a
+    # slot was taken is then a single bit test.
+    prescription_ids = {slot.prescription_id for slot in slots}
+    first_slot = min(slot.scheduled_time for slot in slots)
+    last_slot = max(slot.scheduled_time for slot in slots)
+    taken_bitmaps = load_bitmaps(prescription_ids, first_slot, last_slot)
+    reminded = set(
+        MedicationReminder.objects.filter(
+            prescription_id__in=prescription_ids,
+            scheduled_time__gte=first_slot,
+            scheduled_time__lte=last_slot,
+        ).values_list('prescription_id', 'medicine_name', 'scheduled_time')
+    )
+
+    resolved = defaultdict(list)
+    new_reminders = []
+    outbox = []
+    # Held back for the coalescing window so the dispatcher can merge a patient's reminders
+    deliver_at = timezone.now() + timedelta(seconds=settings.REMINDER_COALESCE_WINDOW_SECONDS)
+    for slot in sorted(slots, key=lambda s: s.scheduled_time):
+        run.slots_evaluated += 1
+        prescription = slot.prescription
+        name = slot.medicine_name
+        scheduled_dt = slot.scheduled_time
+
+        # Skip if already reminded
+        if (slot.prescription_id, name, scheduled_dt) in reminded:
+            resolved['reminded'].append(slot.id)
+            continue
 
-def send_medication_reminders():
-    now = timezone.now()
-    grace_period = now - timedelta(minutes=10)  # 10 min grace
-    prescriptions = Prescription.objects.all()
-    for prescription in prescriptions:
-        # skip expired
-        if prescription.duration_days and (prescription.created_at + timedelta(days=prescription.duration_days)) < now:
+        if is_slot_taken(taken_bitmaps, slot.prescription_id, name, scheduled_dt):
+            resolved['taken'].append(slot.id)
             continue
 
-        medicines = prescription.medicines
-        for medicine in medicines:
-            name = medicine.get('name')
-            frequency = medicine.get('frequency')
-            duration_str = medicine.get('duration', '7-days')
-
-            if duration_str == 'ongoing':
-                duration_days = 365
-            elif duration_str == 'as-needed':
-                continue
-            else:
-                duration_days = int(duration_str.split('-')[0]) if '-' in duration_str else 7
-
-            # Human-friendly fixed times for common daily frequencies
-            fixed_times_map = {
-                'once-daily': ['08:00'],
-                'twice-daily': ['08:00', '20:00'],
-                'three-times-daily': ['08:00', '14:00', '20:00'],
-                'four-times-daily': ['06:00', '12:00', '18:00', '00:00'],
-            }
-
-            if frequency in fixed_times_map:
-                fixed_times = fixed_times_map[frequency]
-                interval_hours = None
-            else:
-                fixed_times = None
-                if frequency == 'every-4-hours':
-                    interval_hours = 4
-                elif frequency == 'every-6-hours':
-                    interval_hours = 6
-                elif frequency == 'every-8-hours':
-                    interval_hours = 8
-                elif frequency == 'every-12-hours':
-                    interval_hours = 12
-                elif frequency == 'weekly':
-                    interval_hours = 24 * 7
-                elif frequency == 'monthly':
-                    interval_hours = 24 * 30
-                elif frequency == 'every-30-minutes':
-                    interval_hours = 0.5
-                else:
-                    interval_hours = 24
-
-            # Fixed-times schedule handling
-            if fixed_times:
-                created_local = prescription.created_at
-                # if created at/after noon, start next day
-                noon = dt_time(12, 0)
-                if created_local.time() >= noon:
-                    day_start = (created_local + timedelta(days=1)).date()
-                else:
-                    day_start = created_local.date()
-
-                for day_offset in range(duration_days):
-                    scheduled_date = day_start + timedelta(days=day_offset)
-                    for t in fixed_times:
-                        hour, minute = map(int, t.split(':'))
-                        naive_dt = datetime.combine(scheduled_date, dt_time(hour, minute))
-                        scheduled_dt = timezone.make_aware(naive_dt)
-
-                        # only consider scheduled times that have passed the grace period
-                        if scheduled_dt > grace_period:
-                            continue
-
-                        # Don't schedule beyond prescription end
-                        if scheduled_dt >= (prescription.created_at + timedelta(days=duration_days)):
-                            continue
-
-                        # Skip if already reminded
-                        if MedicationReminder.objects.filter(prescription=prescription, medicine_name=name, scheduled_time=scheduled_dt).exists():
-                            continue
-
-                        # detection window: ±15 minutes for clock-based schedules
-                        window_minutes = 15
-                        window_start = scheduled_dt - timedelta(minutes=window_minutes)
-                        window_end = scheduled_dt + timedelta(minutes=window_minutes)
-                        taken = TakenDose.objects.filter(
-                            prescription=prescription,
-                            medicine_name=name,
-                            taken_at__gte=window_start,
-                            taken_at__lte=window_end,
-                        ).exists()
-                        if not taken:
-                            patient_phone = prescription.patient.profile.phone_number
-                            if patient_phone:
-                                message = f"Reminder: You missed your {name} dose scheduled at {scheduled_dt.strftime('%H:%M on %Y-%m-%d')}. Please log in to the portal to mark it as taken."
-                                send_sms(message, patient_phone)
-                                try:
-                                    MedicationReminder.objects.create(
-                                        prescription=prescription,
-                                        medicine_name=name,
-                                        scheduled_time=scheduled_dt,
-                                    )
-                                except Exception:
-                                    pass
-
-            else:
-                # interval-based schedule handling
-                start_time = prescription.created_at
-                current_time = start_time
-                end_time = start_time + timedelta(days=duration_days)
-                while current_time < end_time and current_time <= grace_period:
-                    if MedicationReminder.objects.filter(prescription=prescription, medicine_name=name, scheduled_time=current_time).exists():
-                        current_time += timedelta(hours=interval_hours)
-                        continue
-
-                    window_minutes = max(1, int((interval_hours * 60) / 4))
-                    window_minutes = min(window_minutes, 15)
-                    window_start = current_time - timedelta(minutes=window_minutes)
-                    window_end = current_time + timedelta(minutes=window_minutes)
-                    taken = TakenDose.objects.filter(
-                        prescription=prescription,
-                        medicine_name=name,
-                        taken_at__gte=window_start,
-                        taken_at__lte=window_end,
-                    ).exists()
-                    if not taken:
-                        patient_phone = prescription.patient.profile.phone_number
-                        if patient_phone:
-                            message = f"Reminder: You missed your {name} dose scheduled at {current_time.strftime('%H:%M on %Y-%m-%d')}. Please log in to the portal to mark it as taken."
-                            send_sms(message, patient_phone)
-                            try:
-                                MedicationReminder.objects.create(
-                                    prescription=prescription,
-                                    medicine_name=name,
-                                    scheduled_time=current_time,
-                                )
-                            except Exception:
-                                pass
-                    current_time += timedelta(hours=interval_hours)
-
-    # Delete expired prescriptions
-    expired_prescriptions = Prescription.objects.filter(created_at__date__lte=now.date() - timedelta(days=1))
-    for prescription in expired_prescriptions:
-        if prescription.duration_days and (now.date() - prescription.created_at.date()).days >= prescription.duration_days:
-            prescription.delete()
\ No newline at end of file
+        patient_phone = prescription.patient.profile.phone_number
+        if patient_phone:
+            message = f"Reminder: You missed your {name} dose scheduled at {scheduled_dt.strftime('%H:%M on %Y-%m-%d')}. Please log in to the portal to mark it as taken."
+            outbox.append(ReminderOutbox(
+                dedupe_key=f"dose:{slot.prescription_id}:{name}:{int(scheduled_dt.timestamp())}",
+                phone_number=patient_phone,
+                message=message,
+                medicine_name=name,
+                scheduled_time=scheduled_dt,
+                next_attempt_at=deliver_at,
+            ))
+            new_reminders.append(MedicationReminder(
+                prescription_id=slot.prescription_id,
+                medicine_name=name,
+                scheduled_time=scheduled_dt,
+            ))
+            resolved['reminded'].append(slot.id)
+        else:
+            resolved['missed'].append(slot.id)
+
+    # The reminder intents, the duplicate-check rows and the slot statuses commit together,
+    # so a crash can neither lose a reminder nor queue it twice. Delivery is the dispatcher's.
+    with transaction.atomic():
+        ReminderOutbox.objects.bulk_create(outbox, ignore_conflicts=True)
+        MedicationReminder.objects.bulk_create(new_reminders, ignore_conflicts=True)
+        for slot_status, slot_ids in resolved.items():
+            DoseSlot.objects.filter(id__in=slot_ids).update(status=slot_status)
+    return len(outbox)
+
+
+def reminder_job_name(shard=None):
+    """Watermark/lease key for the reminder job, or for one `(index, count)` shard of it."""
+    if shard is None:
+        return 'send_medication_reminders'
+    index, count = shard
+    return f'send_medication_reminders:{index}/{count}'
+
+
+def _pending_slots(now, shard=None):
+    """Unresolved slots of active prescriptions, optionally limited to one patient shard."""
+    slots = (
+        DoseSlot.objects
+        .filter(status='pending')
+        .filter(Q(prescription__expires_at__isnull=True) | Q(prescription__expires_at__gt=now))
+    )
+    if shard is not None:
+        index, count = shard
+        slots = slots.annotate(
+            patient_shard=Mod('prescription__patient_id', count),
+        ).filter(patient_shard=index)
+    return slots
+
+
+def next_reminder_due(shard=None, now=None):
+    """
+    When the next unresolved slot passes its grace period, or None if nothing is pending.
+
+    Only slots after the job's watermark count: earlier ones were already handled, so a
+    stuck slot can never make the worker spin.
+    """
+    now = now or timezone.now()
+    grace = timedelta(minutes=settings.MEDICATION_REMINDER_GRACE_MINUTES)
+    after = now - grace - timedelta(hours=settings.MEDICATION_REMINDER_CATCHUP_HOURS)
+    watermark = JobWatermark.objects.filter(job=reminder_job_name(shard)).values_list('processed_until', flat=True).first()
+    if watermark is not None:
+        after = max(after, watermark)
+    first_slot = (
+        _pending_slots(now, shard)
+        .filter(scheduled_time__gt=after)
+        .order_by('scheduled_time')
+        .values_list('scheduled_time', flat=True)
+        .first()
+    )
+    return first_slot + grace if first_slot else None
+
+
+def send_medication_reminders(shard=None, renew_lease=None):
+    """
+    Remind patients about unresolved doses that are past their grace period.
+
+    With `shard=(index, count)` only patients whose id is `index` modulo `count` are handled,
+    with a watermark of their own; shard 0 also does the table housekeeping. Every call is
+    recorded as a `JobRun`. Reminders are queued in `ReminderOutbox` for the dispatcher;
+    returns how many were queued. `renew_lease` is called between batches; if it returns
+    False the run stops without advancing the watermark.
+    """
+    with record_job_run(reminder_job_name(shard)) as run:
+        return _send_medication_reminders(run, shard, renew_lease)
+
+
+def _send_medication_reminders(run, shard, renew_lease):
+    now = timezone.now()
+    grace = timedelta(minutes=settings.MEDICATION_REMINDER_GRACE_MINUTES)
+    grace_period = now - grace
+    catchup_start = grace_period - timedelta(hours=settings.MEDICATION_REMINDER_CATCHUP_HOURS)
+
+    # Resume from where the last successful run stopped (re-checking one grace period to
+    # absorb clock skew), but never reach further back than the catch-up horizon.
+    watermark, _ = JobWatermark.objects.get_or_create(
+        job=reminder_job_name(shard),
+        defaults={'processed_until': catchup_start},
+    )
+    scan_start = max(watermark.processed_until - grace, catchup_start)
+
+    # Only slots of active prescriptions that are past their grace period and still unresolved
+    due_slots = (
+        _pending_slots(now, shard)
+        .filter(scheduled_time__gt=scan_start, scheduled_time__lte=grace_period)
+        .select_related('prescription__patient__profile')
+        .only(*SLOT_SCAN_FIELDS)
+    )
+    prescription_ids = set()
+    queued = 0
+    try:
+        for batch in _iter_slot_batches(due_slots, settings.MEDICATION_REMINDER_BATCH_SIZE):
+            prescription_ids.update(slot.prescription_id for slot in batch)
+            queued += _process_slot_batch(batch, run)
+            if renew_lease is not None and not renew_lease():
+                logger.warning(f"Lost the {reminder_job_name(shard)} lease; stopping this run")
+                return queued
+    finally:
+        run.prescriptions_scanned = len(prescription_ids)
+
+    # Only advance once every due slot has been handled; a failed run is retried next tick.
+    watermark.processed_until = grace_period
+    watermark.save(update_fields=['processed_until', 'updated_at'])
+
+    if shard is None or shard[0] == 0:
+        # Move expired prescriptions (and their dose history) out of the live tables,
+        # and fold old reminder rows into daily counts so the duplicate check stays small
+        archive_expired_prescriptions(now)
+        compact_medication_reminders(now)
+    return queued
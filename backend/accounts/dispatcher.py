@@ -0,0 +1,161 @@
+"""
+Delivers the SMS reminders queued in `ReminderOutbox`.
+
+Rows are claimed in batches with a conditional UPDATE (pending, or stuck in `sending` past
+the claim timeout) tagged with a per-batch token, so dispatchers can never send a row
+twice. Claimed messages are sent with `send_sms_batch` (a worker pool, rate limited per
+provider); each row is marked sent (or rescheduled with backoff) as soon as its send returns.
+The provider rate limits are per process, so only the process holding the dispatch lease
+sends (`run_dispatcher_if_leader`); other dispatchers are standbys.
+Dose reminders claimed together for the same phone are merged into as few messages as fit
+the SMS segment budget, so a patient who missed three medicines gets one SMS, not three.
+A dispatcher that dies mid-send leaves its rows in `sending` until the claim times out,
+so delivery is at-least-once only in that window.
+"""
+from accounts.job_runs import record_job_run
+from accounts.models import ReminderOutbox
+from accounts.sms_encoding import encode_sms, segment_count
+from accounts.utils import send_sms_batch
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+import logging
+import uuid
+
+logger = logging.getLogger('accounts.cron')
+
+DISPATCH_JOB = 'dispatch_reminders'
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=settings.REMINDER_DISPATCH_CLAIM_TIMEOUT_SECONDS)
+    return Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=stale)
+
+
+def claim_batch(limit, now=None):
+    """
+    Claim up to `limit` deliverable rows for this caller and return them.
+
+    Fresh reminders for the same phones that are still inside their coalescing window are
+    claimed along with them, so they go out in the same message.
+    """
+    now = now or timezone.now()
+    due = list(
+        ReminderOutbox.objects.filter(_claimable(now))
+        .order_by('id')
+        .values_list('id', 'phone_number')[:limit]
+    )
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    # Re-check the condition in the UPDATE: rows another dispatcher claimed meanwhile drop out
+    ReminderOutbox.objects.filter(
+        (Q(id__in=[row_id for row_id, _ in due]) & _claimable(now))
+        | Q(phone_number__in={phone for _, phone in due}, status='pending', attempts=0)
+    ).update(
+        status='sending', claimed_at=now, claimed_by=token, attempts=F('attempts') + 1,
+    )
+    return list(ReminderOutbox.objects.filter(claimed_by=token, status='sending').order_by('id'))
+
+
+def render_message(rows):
+    """One SMS text for a phone's dose reminders; a single row keeps its own message."""
+    if len(rows) == 1:
+        return rows[0].message
+    by_date = defaultdict(list)
+    for row in sorted(rows, key=lambda r: r.scheduled_time):
+        by_date[row.scheduled_time.strftime('%Y-%m-%d')].append(
+            f"{row.medicine_name} at {row.scheduled_time.strftime('%H:%M')}"
+        )
+    doses = '; '.join(f"{', '.join(items)} on {date}" for date, items in by_date.items())
+    return f"Reminder: You missed {len(rows)} doses: {doses}. Please log in to the portal to mark them as taken."
+
+
+def compose_messages(rows, max_segments=None):
+    """
+    Group claimed rows by phone into `(phone, text, rows)` messages.
+
+    Dose reminders for one phone are packed greedily in time order into messages of at
+    most `max_segments` SMS segments (SMS_MAX_SEGMENTS) as they will be encoded; other
+    rows are sent as they are.
+    """
+    max_segments = max_segments or settings.SMS_MAX_SEGMENTS
+    by_phone = defaultdict(list)
+    for row in rows:
+        by_phone[row.phone_number].append(row)
+
+    messages = []
+    for phone, group in by_phone.items():
+        chunk = []
+        for row in sorted(group, key=lambda r: (r.scheduled_time is None, r.scheduled_time or r.created_at)):
+            if not row.medicine_name or row.scheduled_time is None:
+                messages.append((phone, row.message, [row]))
+                continue
+            if chunk and segment_count(encode_sms(render_message(chunk + [row]))) > max_segments:
+                messages.append((phone, render_message(chunk), chunk))
+                chunk = []
+            chunk.append(row)
+        if chunk:
+            messages.append((phone, render_message(chunk), chunk))
+    return messages
+
+
+def _record_result(row, provider_message_id=None, error=None):
+    # Only touch the row if our claim still holds
+    claimed = ReminderOutbox.objects.filter(id=row.id, claimed_by=row.claimed_by, status='sending')
+    if error is None:
+        claimed.update(status='sent', sent_at=timezone.now(), provider_message_id=provider_message_id or '', last_error='')
+    elif row.attempts >= settings.REMINDER_DISPATCH_MAX_ATTEMPTS:
+        claimed.update(status='failed', last_error=error)
+    else:
+        # Exponential backoff: 30s, 60s, 120s, ...
+        retry_at = timezone.now() + timedelta(seconds=30 * 2 ** (row.attempts - 1))
+        claimed.update(status='pending', next_attempt_at=retry_at, last_error=error)
+
+
+def dispatch_reminders(concurrency=None, batch_size=None, renew_lease=None):
+    """
+    Drain the outbox until nothing is deliverable right now. Returns the number of SMS sent.
+
+    `concurrency` sends run in parallel (REMINDER_DISPATCH_CONCURRENCY by default).
+    `renew_lease` is called between batches; if it returns False the run stops early.
+    """
+    concurrency = concurrency or settings.REMINDER_DISPATCH_CONCURRENCY
+    batch_size = batch_size or settings.REMINDER_DISPATCH_BATCH_SIZE
+    # Idle polls are frequent; only runs that have something to send are recorded
+    if not ReminderOutbox.objects.filter(_claimable(timezone.now())).exists():
+        return 0
+
+    with record_job_run(DISPATCH_JOB) as run:
+        while True:
+            rows = claim_batch(batch_size)
+            if not rows:
+                break
+            messages = compose_messages(rows)
+
+            def record(index, result):
+                # Runs in this thread as each send finishes, so rows are marked without
+                # waiting for the rest of the batch
+                message_rows = messages[index][2]
+                run.sms_attempted += 1
+                if result['status'] == 'sent':
+                    run.sms_sent += 1
+                    for row in message_rows:
+                        _record_result(row, provider_message_id=result['message_id'])
+                else:
+                    run.sms_failed += 1
+                    logger.warning(f"Reminder SMS for outbox rows {[row.id for row in message_rows]} failed: {result['error']}")
+                    for row in message_rows:
+                        _record_result(row, error=result['error'])
+
+            send_sms_batch(
+                [(text, phone) for phone, text, _ in messages],
+                concurrency=concurrency,
+                on_result=record,
+            )
+            if renew_lease is not None and not renew_lease():
+                logger.warning("Lost the dispatch lease; stopping this run")
+                break
+        return run.sms_sent
@@ -0,0 +1,79 @@
+"""
+Bitset helpers for `DoseDayBitmap`.
+
+A local day is split into 48 half-hour cells and each taken slot sets the bit of the cell
+it is scheduled in. The most frequent schedule is every 30 minutes, so two slots of the same
+medicine never share a cell, and a slot's (day, cell) can be computed from its timestamp alone,
+without looking the schedule up.
+"""
+from accounts.models import DoseDayBitmap
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+
+CELL_MINUTES = 30
+BITMAP_BYTES = 24 * 60 // CELL_MINUTES // 8
+
+
+def slot_cell(slot_time):
+    """Return (local date, cell index) for a scheduled slot time."""
+    local = timezone.localtime(slot_time)
+    return local.date(), (local.hour * 60 + local.minute) // CELL_MINUTES
+
+
+def has_bit(bits, cell):
+    return bool(bits) and bool(bits[cell >> 3] >> (cell & 7) & 1)
+
+
+def load_bitmaps(prescription_ids, start, end):
+    """Fetch bitmaps for the given prescriptions covering slot times in [start, end] in one query."""
+    rows = DoseDayBitmap.objects.filter(
+        prescription_id__in=prescription_ids,
+        day__gte=timezone.localtime(start).date(),
+        day__lte=timezone.localtime(end).date(),
+    ).values_list('prescription_id', 'medicine_name', 'day', 'taken_bits')
+    return {(prescription_id, name, day): bytes(bits) for prescription_id, name, day, bits in rows}
+
+
+def is_slot_taken(bitmaps, prescription_id, medicine_name, slot_time):
+    day, cell = slot_cell(slot_time)
+    return has_bit(bitmaps.get((prescription_id, medicine_name, day)), cell)
+
+
+def mark_slots_taken(slots):
+    """
+    Set the bits for an iterable of (prescription_id, medicine_name, slot_time).
+
+    Missing day rows are inserted first, then every affected row is locked, OR-ed and
+    written back, so concurrent writers never drop each other's bits.
+    """
+    cells = defaultdict(set)
+    for prescription_id, medicine_name, slot_time in slots:
+        day, cell = slot_cell(slot_time)
+        cells[(prescription_id, medicine_name, day)].add(cell)
+    if not cells:
+        return
+
+    with transaction.atomic():
+        DoseDayBitmap.objects.bulk_create(
+            [
+                DoseDayBitmap(prescription_id=prescription_id, medicine_name=name, day=day)
+                for prescription_id, name, day in cells
+            ],
+            ignore_conflicts=True,
+        )
+        rows = DoseDayBitmap.objects.select_for_update().filter(
+            prescription_id__in={key[0] for key in cells},
+            day__in={key[2] for key in cells},
+        )
+        changed = []
+        for row in rows:
+            new_cells = cells.get((row.prescription_id, row.medicine_name, row.day))
+            if not new_cells:
+                continue
+            bits = bytearray(bytes(row.taken_bits).ljust(BITMAP_BYTES, b'\0'))
+            for cell in new_cells:
+                bits[cell >> 3] |= 1 << (cell & 7)
+            row.taken_bits = bytes(bits)
+            changed.append(row)
+        DoseDayBitmap.objects.bulk_update(changed, ['taken_bits'])
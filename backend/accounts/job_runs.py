@@ -0,0 +1,53 @@
+"""
+Per-run instrumentation for periodic jobs, stored in `JobRun`.
+
+`record_job_run` times a run, counts the queries it issues on this thread's connection and
+saves the counters the job filled in, including failures. Only the newest
+JOB_RUN_HISTORY_PER_JOB rows are kept per job.
+"""
+from accounts.models import JobRun
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger('accounts.cron')
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def prune_job_runs(job, keep=None):
+    """Delete all but the newest `keep` runs of `job`."""
+    keep = keep if keep is not None else settings.JOB_RUN_HISTORY_PER_JOB
+    stale = list(JobRun.objects.filter(job=job).order_by('-id').values_list('id', flat=True)[keep:keep + 1])
+    if stale:
+        JobRun.objects.filter(job=job, id__lte=stale[0]).delete()
+
+
+@contextmanager
+def record_job_run(job):
+    """Yield a `JobRun` whose counters the job increments; it is saved when the block exits."""
+    run = JobRun(job=job, started_at=timezone.now())
+    counter = _QueryCounter()
+    try:
+        with connection.execute_wrapper(counter):
+            yield run
+    except Exception as e:
+        run.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run.finished_at = timezone.now()
+        run.queries = counter.count
+        try:
+            run.save()
+            prune_job_runs(job)
+        except Exception:
+            logger.exception(f"Could not record run of {job}")
@@ -0,0 +1,41 @@
+"""
+Leader election for periodic jobs via a lease row in the database.
+
+Every process that runs the scheduler tries to take the lease on each tick; the lease is
+granted with a single conditional UPDATE (only if it is free, expired or already ours), so
+exactly one process across the deployment wins. The holder renews it on every tick. If it
+dies, the lease expires after its TTL and the next process to tick takes over.
+"""
+from accounts.models import JobLease
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+import logging
+import os
+import socket
+import uuid
+
+logger = logging.getLogger('accounts.cron')
+
+# Identifies this process; unique even when PIDs are reused across containers
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(name, ttl_seconds, holder=HOLDER_ID, now=None):
+    """Take or renew the lease `name` for `ttl_seconds`. Returns True if `holder` now owns it."""
+    now = now or timezone.now()
+    JobLease.objects.bulk_create(
+        [JobLease(name=name, holder='', expires_at=now)],
+        ignore_conflicts=True,
+    )
+    acquired = JobLease.objects.filter(name=name).filter(
+        Q(holder=holder) | Q(holder='') | Q(expires_at__lte=now)
+    ).update(holder=holder, expires_at=now + timedelta(seconds=ttl_seconds)) == 1
+    if not acquired:
+        logger.debug(f"Lease {name} held by another process")
+    return acquired
+
+
+def release_lease(name, holder=HOLDER_ID):
+    """Give the lease up early (e.g. on shutdown) so another process can take over at once."""
+    return JobLease.objects.filter(name=name, holder=holder).update(holder='', expires_at=timezone.now()) == 1
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts import sms_clients
+from accounts.scheduler import release_dispatch_lease, run_dispatcher_if_leader
+import logging
+import signal
+import threading
+
+logger = logging.getLogger('accounts.cron')
+
+
+class Command(BaseCommand):
+    help = "Deliver queued SMS reminders from the outbox (extra dispatchers wait as standbys for the lease)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=settings.REMINDER_DISPATCH_TICK_SECONDS,
+                            help="Seconds to wait after the outbox is drained")
+        parser.add_argument('--concurrency', type=int, default=settings.REMINDER_DISPATCH_CONCURRENCY,
+                            help="Messages sent in parallel")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the outbox once and exit")
+
+    def handle(self, *args, **options):
+        if options['tick'] <= 0 or options['concurrency'] < 1:
+            raise CommandError("--tick and --concurrency must be positive")
+        # Build provider clients (and their connection pools) before the first message
+        sms_clients.warm_up()
+
+        if options['once']:
+            try:
+                sent = run_dispatcher_if_leader(concurrency=options['concurrency'])
+            except Exception as e:
+                raise CommandError(f"Dispatch failed: {e}")
+            finally:
+                release_dispatch_lease()
+            if sent is None:
+                self.stdout.write("Another dispatcher holds the lease; skipped")
+            else:
+                self.stdout.write(f"Sent {sent} reminders")
+            return
+
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            logger.info(f"Reminder dispatcher got signal {signum}, stopping after the current batch")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(f"Reminder dispatcher started (concurrency {options['concurrency']})")
+        try:
+            while not stop.is_set():
+                try:
+                    run_dispatcher_if_leader(concurrency=options['concurrency'])
+                except Exception:
+                    logger.exception("Reminder dispatch failed; retrying next tick")
+                stop.wait(options['tick'])
+        finally:
+            release_dispatch_lease()
+        self.stdout.write("Reminder dispatcher stopped")
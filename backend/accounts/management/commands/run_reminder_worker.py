@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.scheduler import release_reminder_lease, run_reminders_if_leader, seconds_until_next_run
+from accounts.wakeup import WakeupListener
+import argparse
+import logging
+import random
+import signal
+import threading
+
+logger = logging.getLogger('accounts.cron')
+
+
+def parse_shard(value):
+    """Parse `i/n` into (i, n) with 0 <= i < n."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"need 0 <= i < n, got {value!r}")
+    return index, count
+
+
+class Command(BaseCommand):
+    help = "Run the medication reminder job in its own process (set MEDICATION_REMINDER_IN_PROCESS_SCHEDULER=False)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=settings.MEDICATION_REMINDER_TICK_SECONDS,
+                            help="Longest sleep between runs; otherwise the worker sleeps until the next dose is due")
+        parser.add_argument('--jitter', type=float, default=5.0,
+                            help="Random extra delay (0..jitter seconds) added to each sleep")
+        parser.add_argument('--once', action='store_true',
+                            help="Run a single tick and exit (for cron / Kubernetes CronJob)")
+        parser.add_argument('--shards', type=parse_shard, default=None, metavar='i/n',
+                            help="Only handle patients whose id is i modulo n")
+
+    def handle(self, *args, **options):
+        shard = options['shards']
+        if options['tick'] <= 0 or options['jitter'] < 0:
+            raise CommandError("--tick must be positive and --jitter non-negative")
+
+        if options['once']:
+            try:
+                queued = run_reminders_if_leader(shard)
+            except Exception as e:
+                raise CommandError(f"Reminder run failed: {e}")
+            finally:
+                release_reminder_lease(shard)
+            if queued is None:
+                self.stdout.write("Another worker holds the lease; skipped")
+            else:
+                self.stdout.write(f"Reminder run complete, {queued} reminders queued")
+            return
+
+        stop = threading.Event()
+        listener = WakeupListener()
+
+        def request_stop(signum, frame):
+            logger.info(f"Reminder worker got signal {signum}, stopping after the current run")
+            stop.set()
+            listener.wake()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        tick = options['tick']
+        label = f"shard {shard[0]}/{shard[1]}" if shard else "all patients"
+        self.stdout.write(f"Reminder worker started ({label}, max sleep {tick}s)")
+        # Jitter the first run too, so workers started together do not hit the DB in lockstep
+        delay = random.uniform(0, options['jitter'])
+        try:
+            while not stop.is_set():
+                if delay > 0 and listener.wait(delay):
+                    # A prescription or dose was written: the next deadline may have moved up
+                    delay = 0 if stop.is_set() else seconds_until_next_run(shard, tick)
+                    continue
+                if stop.is_set():
+                    break
+                try:
+                    ran = run_reminders_if_leader(shard) is not None
+                except Exception:
+                    logger.exception("Reminder run failed; retrying next tick")
+                    ran = False
+                # Sleep until the next slot is due, or a full tick if another process is leader
+                delay = (seconds_until_next_run(shard, tick) if ran else tick) + random.uniform(0, options['jitter'])
+        finally:
+            listener.close()
+            release_reminder_lease(shard)
+        self.stdout.write("Reminder worker stopped")
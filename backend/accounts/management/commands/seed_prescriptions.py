@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from accounts.models import Prescription
+from accounts.schedule import parse_medicine
 
 def assign_medication(patient_id, doctor_id, medicines_list):
     """
@@ -17,17 +18,12 @@ def assign_medication(patient_id, doctor_id, medicines_list):
     except User.DoesNotExist:
         raise ValueError("Invalid doctor or patient ID")
 
-    # Calculate duration_days from medicines (take max duration or default to 7)
+    # Calculate duration_days from medicines (take max fixed duration or default to 7)
     duration_days = 7  # default
     for med in medicines_list:
-        duration_str = med.get('duration', '7-days')
-        if duration_str != 'ongoing' and duration_str != 'as-needed':
-            try:
-                days = int(duration_str.split('-')[0])
-                if days > duration_days:
-                    duration_days = days
-            except (ValueError, IndexError):
-                pass
+        parsed = parse_medicine(med)
+        if parsed['duration'] != 'ongoing' and not parsed['as_needed']:
+            duration_days = max(duration_days, parsed['duration_days'])
 
     prescription = Prescription.objects.create(
         doctor=doctor,
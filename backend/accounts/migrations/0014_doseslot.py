@@ -0,0 +1,140 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:31
+
+import django.db.models.deletion
+from datetime import datetime, timedelta, time as dt_time
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of the accounts.schedule expansion as of this migration, so later changes to
+# the schedule engine cannot change which slots this backfill creates.
+
+# Human-friendly fixed times for common daily frequencies
+FIXED_TIMES_MAP = {
+    'once-daily': ['08:00'],
+    'twice-daily': ['08:00', '20:00'],
+    'three-times-daily': ['08:00', '14:00', '20:00'],
+    'four-times-daily': ['06:00', '12:00', '18:00', '00:00'],
+}
+
+# Interval-based frequencies, in hours. Anything unknown falls back to daily.
+INTERVAL_HOURS_MAP = {
+    'every-4-hours': 4,
+    'every-6-hours': 6,
+    'every-8-hours': 8,
+    'every-12-hours': 12,
+    'weekly': 24 * 7,
+    'monthly': 24 * 30,
+    'every-30-minutes': 0.5,
+}
+
+
+def parse_duration_days(duration_str):
+    """Return the number of days a medicine runs for, or None for 'as-needed'."""
+    if duration_str == 'ongoing':
+        return 365
+    if duration_str == 'as-needed':
+        return None
+    return int(duration_str.split('-')[0]) if '-' in duration_str else 7
+
+
+def expand_dose_times(created_at, medicine):
+    """
+    Yield every (scheduled_time, window_minutes) for a single medicine entry.
+
+    Fixed-time frequencies use clock times starting on the creation day (or the next
+    day if the prescription was created after noon). Everything else runs on an
+    interval from `created_at`. Nothing is yielded for 'as-needed' medicines.
+    """
+    duration_days = parse_duration_days(medicine.get('duration', '7-days'))
+    if duration_days is None:
+        return
+
+    frequency = medicine.get('frequency')
+    end_time = created_at + timedelta(days=duration_days)
+
+    if frequency in FIXED_TIMES_MAP:
+        # if created at/after noon, start next day
+        noon = dt_time(12, 0)
+        if created_at.time() >= noon:
+            day_start = (created_at + timedelta(days=1)).date()
+        else:
+            day_start = created_at.date()
+
+        # detection window: ±15 minutes for clock-based schedules
+        window_minutes = 15
+        for day_offset in range(duration_days):
+            scheduled_date = day_start + timedelta(days=day_offset)
+            for t in FIXED_TIMES_MAP[frequency]:
+                hour, minute = map(int, t.split(':'))
+                naive_dt = datetime.combine(scheduled_date, dt_time(hour, minute))
+                scheduled_dt = timezone.make_aware(naive_dt)
+                # Don't schedule beyond prescription end
+                if scheduled_dt >= end_time:
+                    continue
+                yield scheduled_dt, window_minutes
+    else:
+        interval_hours = INTERVAL_HOURS_MAP.get(frequency, 24)
+        window_minutes = max(1, int((interval_hours * 60) / 4))
+        window_minutes = min(window_minutes, 15)
+        current_time = created_at
+        while current_time < end_time:
+            yield current_time, window_minutes
+            current_time += timedelta(hours=interval_hours)
+
+
+def backfill_dose_slots(apps, schema_editor):
+    Prescription = apps.get_model('accounts', 'Prescription')
+    DoseSlot = apps.get_model('accounts', 'DoseSlot')
+    MedicationReminder = apps.get_model('accounts', 'MedicationReminder')
+
+    for prescription in Prescription.objects.iterator():
+        reminded = set(
+            MedicationReminder.objects.filter(prescription=prescription)
+            .values_list('medicine_name', 'scheduled_time')
+        )
+        # Slots past the prescription's own end are never reminded about
+        expires_at = None
+        if prescription.duration_days:
+            expires_at = prescription.created_at + timedelta(days=prescription.duration_days)
+        slots = []
+        for medicine in prescription.medicines:
+            name = medicine.get('name')
+            if not name:
+                continue
+            for scheduled_time, window_minutes in expand_dose_times(prescription.created_at, medicine):
+                if expires_at and scheduled_time >= expires_at:
+                    continue
+                slots.append(DoseSlot(
+                    prescription=prescription,
+                    medicine_name=name,
+                    scheduled_time=scheduled_time,
+                    window_minutes=window_minutes,
+                    status='reminded' if (name, scheduled_time) in reminded else 'pending',
+                ))
+        DoseSlot.objects.bulk_create(slots, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_passwordresetotp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoseSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medicine_name', models.CharField(max_length=100)),
+                ('scheduled_time', models.DateTimeField()),
+                ('window_minutes', models.PositiveIntegerField(default=15)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('taken', 'Taken'), ('reminded', 'Reminded'), ('missed', 'Missed')], default='pending', max_length=10)),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dose_slots', to='accounts.prescription')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'scheduled_time'], name='accounts_do_status_5080ae_idx')],
+                'unique_together': {('prescription', 'medicine_name', 'scheduled_time')},
+            },
+        ),
+        migrations.RunPython(backfill_dose_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:34
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_expires_at(apps, schema_editor):
+    Prescription = apps.get_model('accounts', 'Prescription')
+    batch = []
+    for prescription in Prescription.objects.only('id', 'created_at', 'duration_days').iterator(chunk_size=1000):
+        if prescription.duration_days:
+            prescription.expires_at = prescription.created_at + timedelta(days=prescription.duration_days)
+            batch.append(prescription)
+    Prescription.objects.bulk_update(batch, ['expires_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_jobwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescription',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+    ]
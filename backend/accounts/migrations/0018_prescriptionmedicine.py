@@ -0,0 +1,105 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of accounts.schedule.parse_medicine as of this migration, so later changes to
+# the schedule engine cannot change what this backfill writes. Values are cut to the widths
+# of the columns created here.
+FIXED_TIMES_MAP = {
+    'once-daily': ['08:00'],
+    'twice-daily': ['08:00', '20:00'],
+    'three-times-daily': ['08:00', '14:00', '20:00'],
+    'four-times-daily': ['06:00', '12:00', '18:00', '00:00'],
+}
+
+INTERVAL_HOURS_MAP = {
+    'every-4-hours': 4,
+    'every-6-hours': 6,
+    'every-8-hours': 8,
+    'every-12-hours': 12,
+    'weekly': 24 * 7,
+    'monthly': 24 * 30,
+    'every-30-minutes': 0.5,
+}
+
+
+def parse_duration_days(duration_str):
+    if duration_str == 'ongoing':
+        return 365
+    if duration_str == 'as-needed':
+        return None
+    try:
+        return int(duration_str.split('-')[0]) if '-' in duration_str else 7
+    except ValueError:
+        return 7
+
+
+def parse_medicine(medicine):
+    frequency = str(medicine.get('frequency') or '')
+    duration = str(medicine.get('duration', '7-days') or '7-days')
+    duration_days = parse_duration_days(duration)
+
+    fixed_offsets = []
+    interval_minutes = None
+    if frequency in FIXED_TIMES_MAP:
+        for t in FIXED_TIMES_MAP[frequency]:
+            hour, minute = map(int, t.split(':'))
+            fixed_offsets.append(hour * 60 + minute)
+    else:
+        interval_minutes = int(INTERVAL_HOURS_MAP.get(frequency, 24) * 60)
+
+    return {
+        'name': str(medicine.get('name') or '')[:100],
+        'dosage': str(medicine.get('dosage') or '')[:100],
+        'frequency': frequency[:50],
+        'duration': duration[:50],
+        'interval_minutes': interval_minutes,
+        'fixed_offsets': fixed_offsets,
+        'duration_days': duration_days,
+        'as_needed': duration_days is None or frequency == 'as-needed',
+    }
+
+
+def backfill_prescription_medicines(apps, schema_editor):
+    Prescription = apps.get_model('accounts', 'Prescription')
+    PrescriptionMedicine = apps.get_model('accounts', 'PrescriptionMedicine')
+    items = []
+    for prescription in Prescription.objects.only('id', 'medicines').iterator(chunk_size=500):
+        for position, medicine in enumerate(prescription.medicines):
+            if medicine.get('name'):
+                items.append(PrescriptionMedicine(prescription_id=prescription.id, position=position, **parse_medicine(medicine)))
+        if len(items) >= 1000:
+            PrescriptionMedicine.objects.bulk_create(items)
+            items = []
+    PrescriptionMedicine.objects.bulk_create(items)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_archivedprescription_archivedtakendose'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrescriptionMedicine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('name', models.CharField(db_index=True, max_length=100)),
+                ('dosage', models.CharField(blank=True, max_length=100)),
+                ('frequency', models.CharField(blank=True, max_length=50)),
+                ('duration', models.CharField(blank=True, max_length=50)),
+                ('interval_minutes', models.PositiveIntegerField(blank=True, null=True)),
+                ('fixed_offsets', models.JSONField(blank=True, default=list)),
+                ('duration_days', models.PositiveIntegerField(blank=True, null=True)),
+                ('as_needed', models.BooleanField(default=False)),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='medicine_items', to='accounts.prescription')),
+            ],
+            options={
+                'ordering': ['prescription', 'position'],
+            },
+        ),
+        migrations.RunPython(backfill_prescription_medicines, migrations.RunPython.noop),
+    ]
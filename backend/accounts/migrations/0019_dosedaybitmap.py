@@ -0,0 +1,95 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:42
+
+import django.db.models.deletion
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of the accounts.dose_bitmap layout as of this migration: 48 half-hour cells a day
+CELL_MINUTES = 30
+BITMAP_BYTES = 24 * 60 // CELL_MINUTES // 8
+
+
+def slot_cell(slot_time):
+    """Return (local date, cell index) for a scheduled slot time."""
+    local = timezone.localtime(slot_time)
+    return local.date(), (local.hour * 60 + local.minute) // CELL_MINUTES
+
+
+def backfill_dose_bitmaps(apps, schema_editor):
+    """
+    Set a bit for every slot an existing TakenDose accounts for: the nearest slot within the
+    slot's window, or else a slot in the same local hour (the old pending-doses rule).
+    """
+    Prescription = apps.get_model('accounts', 'Prescription')
+    DoseSlot = apps.get_model('accounts', 'DoseSlot')
+    TakenDose = apps.get_model('accounts', 'TakenDose')
+    DoseDayBitmap = apps.get_model('accounts', 'DoseDayBitmap')
+
+    for prescription_id in Prescription.objects.values_list('id', flat=True).iterator():
+        slots = defaultdict(list)
+        for name, scheduled_time, window_minutes in DoseSlot.objects.filter(
+            prescription_id=prescription_id,
+        ).values_list('medicine_name', 'scheduled_time', 'window_minutes').order_by('scheduled_time'):
+            slots[name].append((scheduled_time, window_minutes))
+
+        bitmaps = defaultdict(lambda: bytearray(BITMAP_BYTES))
+        for name, taken_at in TakenDose.objects.filter(
+            prescription_id=prescription_id,
+        ).values_list('medicine_name', 'taken_at'):
+            medicine_slots = slots.get(name)
+            if not medicine_slots:
+                continue
+            i = bisect_left(medicine_slots, (taken_at,))
+            candidates = medicine_slots[max(0, i - 1):i + 1]
+            match = None
+            for scheduled_time, window_minutes in candidates:
+                if abs(scheduled_time - taken_at) <= timedelta(minutes=window_minutes):
+                    if match is None or abs(scheduled_time - taken_at) < abs(match - taken_at):
+                        match = scheduled_time
+            if match is None:
+                taken_local = timezone.localtime(taken_at)
+                for scheduled_time, _ in candidates:
+                    local = timezone.localtime(scheduled_time)
+                    if (local.date(), local.hour) == (taken_local.date(), taken_local.hour):
+                        match = scheduled_time
+                        break
+            if match is None:
+                continue
+            day, cell = slot_cell(match)
+            bitmaps[(name, day)][cell >> 3] |= 1 << (cell & 7)
+
+        DoseDayBitmap.objects.bulk_create(
+            [
+                DoseDayBitmap(prescription_id=prescription_id, medicine_name=name, day=day, taken_bits=bytes(bits))
+                for (name, day), bits in bitmaps.items()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_prescriptionmedicine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoseDayBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medicine_name', models.CharField(max_length=100)),
+                ('day', models.DateField()),
+                ('taken_bits', models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00', max_length=6)),
+                ('prescription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dose_bitmaps', to='accounts.prescription')),
+            ],
+            options={
+                'unique_together': {('prescription', 'medicine_name', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_dose_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_joblease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('prescriptions_scanned', models.PositiveIntegerField(default=0)),
+                ('slots_evaluated', models.PositiveIntegerField(default=0)),
+                ('queries', models.PositiveIntegerField(default=0)),
+                ('sms_attempted', models.PositiveIntegerField(default=0)),
+                ('sms_sent', models.PositiveIntegerField(default=0)),
+                ('sms_failed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['job', 'started_at'], name='accounts_jo_job_ec8798_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0023_reminderoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminderoutbox',
+            name='medicine_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='reminderoutbox',
+            name='scheduled_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
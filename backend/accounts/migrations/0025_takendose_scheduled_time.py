@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:15
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_scheduled_time(apps, schema_editor):
+    """
+    Attach existing doses to the nearest slot within that slot's window, at most one dose
+    per slot. Doses with no such slot keep a null scheduled_time.
+    """
+    Prescription = apps.get_model('accounts', 'Prescription')
+    DoseSlot = apps.get_model('accounts', 'DoseSlot')
+    TakenDose = apps.get_model('accounts', 'TakenDose')
+
+    for prescription_id in Prescription.objects.values_list('id', flat=True).iterator():
+        slots = defaultdict(list)
+        for name, scheduled_time, window_minutes in DoseSlot.objects.filter(
+            prescription_id=prescription_id,
+        ).values_list('medicine_name', 'scheduled_time', 'window_minutes').order_by('scheduled_time'):
+            slots[name].append((scheduled_time, window_minutes))
+
+        used = set()
+        updates = []
+        for dose in TakenDose.objects.filter(prescription_id=prescription_id).order_by('taken_at'):
+            medicine_slots = slots.get(dose.medicine_name)
+            if not medicine_slots:
+                continue
+            i = bisect_left(medicine_slots, (dose.taken_at,))
+            match = None
+            for scheduled_time, window_minutes in medicine_slots[max(0, i - 1):i + 1]:
+                distance = abs(scheduled_time - dose.taken_at)
+                if distance <= timedelta(minutes=window_minutes) and (dose.medicine_name, scheduled_time) not in used:
+                    if match is None or distance < abs(match - dose.taken_at):
+                        match = scheduled_time
+            if match is not None:
+                used.add((dose.medicine_name, match))
+                dose.scheduled_time = match
+                updates.append(dose)
+        TakenDose.objects.bulk_update(updates, ['scheduled_time'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0024_reminderoutbox_medicine'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='takendose',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='archivedtakendose',
+            name='scheduled_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='takendose',
+            name='scheduled_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_scheduled_time, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='takendose',
+            unique_together={('prescription', 'medicine_name', 'scheduled_time')},
+        ),
+    ]
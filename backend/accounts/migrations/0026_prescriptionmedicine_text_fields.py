@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0025_takendose_scheduled_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='prescriptionmedicine',
+            name='dosage',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='prescriptionmedicine',
+            name='duration',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='prescriptionmedicine',
+            name='frequency',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -1,8 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User, Group
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.db.models import Q
+from django.utils import timezone
 from datetime import datetime, timedelta
+import copy
+from .schedule import MEDICINE_NAME_MAX_LENGTH, compile_schedule, parse_medicine
+from .wakeup import notify_reminder_worker
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -68,6 +73,12 @@ class ChatMessage(models.Model):
     def __str__(self):
         return f"Message from {self.sender} at {self.timestamp}"
 
+class PrescriptionQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """Prescriptions that have not expired yet (a duration of 0 days never expires)."""
+        now = now or timezone.now()
+        return self.filter(Q(expires_at__isnull=True) | Q(expires_at__gt=now))
+
 class Prescription(models.Model):
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_prescriptions', limit_choices_to={'groups__name': 'Doctor'})
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_prescriptions', limit_choices_to={'groups__name': 'Patient'})
@@ -76,22 +87,98 @@ class Prescription(models.Model):
     duration_days = models.PositiveIntegerField(default=7)  # Duration in days for the prescription
     last_reminder_sent = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized created_at + duration_days so expiry can be filtered (and indexed) in SQL
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True, editable=False)
+
+    objects = PrescriptionQuerySet.as_manager()
 
     def __str__(self):
         return f"Prescription by {self.doctor.username} for {self.patient.username}"
 
+    def compute_expires_at(self):
+        if not self.duration_days:
+            return None
+        return (self.created_at or timezone.now()) + timedelta(days=self.duration_days)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not {'medicines', 'duration_days'} & instance.get_deferred_fields():
+            instance.remember_synced_schedule()
+        return instance
+
+    def remember_synced_schedule(self):
+        # What the medicine items and dose slots were last built from; see sync_prescription_medicines
+        self._synced_schedule = (copy.deepcopy(self.medicines), self.duration_days)
+
+    def save(self, *args, **kwargs):
+        self.expires_at = self.compute_expires_at()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'duration_days' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'expires_at'}
+        # The post_save receiver writes the medicine items and dose slots; if that fails the
+        # prescription must not be left behind without them
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+class PrescriptionMedicine(models.Model):
+    """One medicine of a prescription, with its schedule parsed into typed columns at write time."""
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='medicine_items')
+    position = models.PositiveSmallIntegerField(default=0)  # order within Prescription.medicines
+    name = models.CharField(max_length=MEDICINE_NAME_MAX_LENGTH, db_index=True)  # truncated by parse_medicine
+    # Free text from the transcription model, so no length limit
+    dosage = models.TextField(blank=True)
+    frequency = models.TextField(blank=True)  # original label, e.g. 'every-8-hours'
+    duration = models.TextField(blank=True)  # original label, e.g. '7-days' or 'ongoing'
+    interval_minutes = models.PositiveIntegerField(null=True, blank=True)  # interval schedules only
+    fixed_offsets = models.JSONField(default=list, blank=True)  # minutes after midnight, fixed-time schedules only
+    duration_days = models.PositiveIntegerField(null=True, blank=True)
+    as_needed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['prescription', 'position']
+
+    def __str__(self):
+        return f"{self.name} ({self.frequency}) on prescription {self.prescription_id}"
+
+    def schedule(self, created_at):
+        """Compiled dose schedule for this medicine, or None for as-needed medicines."""
+        if self.as_needed:
+            return None
+        return compile_schedule(created_at, self.interval_minutes, self.fixed_offsets, self.duration_days)
+
 class TakenDose(models.Model):
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='taken_doses')
     medicine_name = models.CharField(max_length=100)
-    taken_at = models.DateTimeField()
+    taken_at = models.DateTimeField()  # when the patient confirmed the dose
+    # The slot the confirmation is for; null only for doses recorded before slots were tracked
+    scheduled_time = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        unique_together = ('prescription', 'medicine_name', 'taken_at')
+        unique_together = ('prescription', 'medicine_name', 'scheduled_time')
 
     def __str__(self):
         return f"{self.medicine_name} taken at {self.taken_at}"
 
 
+class DoseDayBitmap(models.Model):
+    """Compact per-day record of which scheduled slots of a medicine were taken.
+
+    One bit per half-hour cell of the local day (48 bits, 6 bytes); see accounts.dose_bitmap.
+    Kept in step with TakenDose so "was this slot taken?" is a bit test instead of a range scan.
+    """
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='dose_bitmaps')
+    medicine_name = models.CharField(max_length=100)
+    day = models.DateField()
+    taken_bits = models.BinaryField(max_length=6, default=bytes(6))
+
+    class Meta:
+        unique_together = ('prescription', 'medicine_name', 'day')
+
+    def __str__(self):
+        return f"{self.medicine_name} doses on {self.day}"
+
+
 class MedicationReminder(models.Model):
     """Tracks which scheduled dose-times we've already reminded for.
 
@@ -100,7 +187,7 @@ class MedicationReminder(models.Model):
     prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='reminders')
     medicine_name = models.CharField(max_length=100)
     scheduled_time = models.DateTimeField()
-    sent_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         unique_together = ('prescription', 'medicine_name', 'scheduled_time')
@@ -108,6 +195,153 @@ class MedicationReminder(models.Model):
     def __str__(self):
         return f"Reminder for {self.medicine_name} at {self.scheduled_time}"
 
+
+class ReminderOutbox(models.Model):
+    """An SMS reminder waiting to be delivered by the dispatcher (accounts.dispatcher).
+
+    The reminder scan only inserts rows here; `dedupe_key` makes enqueueing the same reminder
+    twice a no-op, and dispatchers claim rows with a conditional UPDATE so each is sent once.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    dedupe_key = models.CharField(max_length=255, unique=True)
+    phone_number = models.CharField(max_length=20)
+    message = models.TextField()
+    # Set for dose reminders, so several queued for one phone can be merged into one SMS
+    medicine_name = models.CharField(max_length=100, blank=True)
+    scheduled_time = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    provider_message_id = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"SMS to {self.phone_number} ({self.status})"
+
+
+class ReminderDailySummary(models.Model):
+    """Reminders sent to a patient per medicine per day, kept after the raw rows are compacted."""
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reminder_summaries')
+    medicine_name = models.CharField(max_length=100)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('patient', 'medicine_name', 'day')
+
+    def __str__(self):
+        return f"{self.count} reminders for {self.medicine_name} on {self.day}"
+
+
+class DoseSlot(models.Model):
+    """One scheduled dose of one medicine, materialized when the prescription is created.
+
+    The reminder cron only has to range-scan due pending slots instead of re-expanding
+    every prescription's schedule on each tick.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('taken', 'Taken'),
+        ('reminded', 'Reminded'),
+        ('missed', 'Missed'),
+    ]
+
+    prescription = models.ForeignKey(Prescription, on_delete=models.CASCADE, related_name='dose_slots')
+    medicine_name = models.CharField(max_length=100)
+    scheduled_time = models.DateTimeField()
+    window_minutes = models.PositiveIntegerField(default=15)  # ± tolerance when matching a TakenDose
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    class Meta:
+        unique_together = ('prescription', 'medicine_name', 'scheduled_time')
+        indexes = [
+            models.Index(fields=['status', 'scheduled_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine_name} due at {self.scheduled_time} ({self.status})"
+
+class ArchivedPrescription(models.Model):
+    """Compact copy of an expired prescription, kept for adherence history after the live row is purged."""
+    original_id = models.BigIntegerField(unique=True)
+    doctor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='archived_doctor_prescriptions')
+    patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_patient_prescriptions')
+    medicines = models.JSONField()
+    duration_days = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived prescription {self.original_id} for patient {self.patient_id}"
+
+class ArchivedTakenDose(models.Model):
+    prescription = models.ForeignKey(ArchivedPrescription, on_delete=models.CASCADE, related_name='taken_doses')
+    medicine_name = models.CharField(max_length=100)
+    taken_at = models.DateTimeField()
+    scheduled_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.medicine_name} taken at {self.taken_at} (archived)"
+
+class JobWatermark(models.Model):
+    """Persisted progress marker for a periodic job, so each run only looks at new work."""
+    job = models.CharField(max_length=100, unique=True)
+    processed_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job} processed until {self.processed_until}"
+
+
+class JobRun(models.Model):
+    """One execution of a periodic job with its counters; see accounts.job_runs."""
+    job = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    prescriptions_scanned = models.PositiveIntegerField(default=0)
+    slots_evaluated = models.PositiveIntegerField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    sms_attempted = models.PositiveIntegerField(default=0)
+    sms_sent = models.PositiveIntegerField(default=0)
+    sms_failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [models.Index(fields=['job', 'started_at'])]
+
+    @property
+    def duration_ms(self):
+        if self.finished_at is None:
+            return None
+        return int((self.finished_at - self.started_at).total_seconds() * 1000)
+
+    def __str__(self):
+        return f"{self.job} at {self.started_at}"
+
+
+class JobLease(models.Model):
+    """Time-limited ownership of a periodic job by one process; see accounts.leader."""
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder or 'nobody'} until {self.expires_at}"
+
 class Appointment(models.Model):
     doctor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='doctor_appointments', limit_choices_to={'groups__name': 'Doctor'})
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_appointments', limit_choices_to={'groups__name': 'Patient'})
@@ -155,3 +389,58 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+@receiver(post_save, sender=Prescription)
+def sync_prescription_medicines(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and not {'medicines', 'duration_days'} & set(update_fields):
+        return
+    # Instances not loaded from the database (or with those fields deferred) are rebuilt
+    synced = None if created else getattr(instance, '_synced_schedule', None)
+    medicines_changed = synced is None or synced[0] != instance.medicines
+    if not medicines_changed and synced[1] == instance.duration_days:
+        return
+    if medicines_changed:
+        if not created:
+            instance.medicine_items.all().delete()
+        items = PrescriptionMedicine.objects.bulk_create([
+            PrescriptionMedicine(prescription=instance, position=position, **parse_medicine(medicine))
+            for position, medicine in enumerate(instance.medicines)
+            if medicine.get('name')
+        ])
+    else:
+        # Only duration_days (and so expires_at) changed: keep the items, regenerate the slots
+        items = list(instance.medicine_items.all())
+    slots = []
+    for item in items:
+        schedule = item.schedule(instance.created_at)
+        if schedule is None:
+            continue
+        slots.extend(
+            DoseSlot(
+                prescription=instance,
+                medicine_name=item.name,
+                scheduled_time=scheduled_time,
+                window_minutes=schedule.window_minutes,
+            )
+            # Past expires_at the prescription is archived, so later slots would never be used
+            for scheduled_time in schedule.all_slots(until=instance.expires_at)
+        )
+    if not created:
+        # Drop unresolved slots the new medicines no longer schedule; resolved ones are history
+        keep = {(slot.medicine_name, slot.scheduled_time) for slot in slots}
+        DoseSlot.objects.filter(id__in=[
+            slot_id
+            for slot_id, name, scheduled_time in instance.dose_slots.filter(status='pending')
+            .values_list('id', 'medicine_name', 'scheduled_time')
+            if (name, scheduled_time) not in keep
+        ]).delete()
+    DoseSlot.objects.bulk_create(slots, batch_size=1000, ignore_conflicts=True)
+    instance.remember_synced_schedule()
+
+
+@receiver(post_save, sender=Prescription)
+def wake_reminder_worker(sender, instance, created, using='default', **kwargs):
+    # New slots can move the reminder worker's next deadline. Taken doses are bulk-created
+    # (no post_save), so the view that records them notifies the worker itself.
+    if created:
+        notify_reminder_worker(using)
@@ -0,0 +1,257 @@
+"""
+Pluggable notification backends, chosen in settings like Django's EMAIL_BACKEND.
+
+SMS_BACKEND and NOTIFICATION_EMAIL_BACKEND name a class by dotted path. The provider
+backends talk to Twilio / AWS SNS and Brevo; the stand-ins keep messages in memory
+(`LocMem*`, readable from `.outbox`) or append them to a JSONL file (`File*`), and can
+simulate provider latency and failures (NOTIFICATION_STANDIN_LATENCY_MS,
+NOTIFICATION_STANDIN_FAILURE_RATE) so the whole reminder / OTP pipeline can be load-tested
+offline.
+"""
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from sib_api_v3_sdk.api.transactional_emails_api import TransactionalEmailsApi
+from sib_api_v3_sdk.models.send_smtp_email import SendSmtpEmail
+from . import sms_clients
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .rate_limit import get_bucket
+import json
+import logging
+import random
+import sib_api_v3_sdk
+import threading
+import time
+import uuid
+
+logger = logging.getLogger('accounts.cron')
+
+
+class BaseSMSBackend:
+    def send_sms(self, message_text, recipient):
+        """Send one SMS to a normalised +<country><number> recipient; return the message id or raise."""
+        raise NotImplementedError
+
+
+class BaseEmailBackend:
+    def send_email(self, receiver_email, subject, html_content):
+        """Send one HTML email; raise on failure."""
+        raise NotImplementedError
+
+
+def _take_send_token(provider):
+    """Wait for the provider's rate limit to allow one more message (False if that takes too long)."""
+    bucket = get_bucket(provider)
+    if bucket is None or bucket.acquire(timeout=settings.SMS_RATE_LIMIT_MAX_WAIT_SECONDS):
+        return True
+    logger.warning(f"{provider} rate limit: no send slot within {settings.SMS_RATE_LIMIT_MAX_WAIT_SECONDS}s")
+    return False
+
+
+class ProviderSMSBackend(BaseSMSBackend):
+    """Twilio first, AWS SNS as fallback, each behind its rate limit and circuit breaker."""
+
+    def send_sms(self, message_text, recipient):
+        # Long-lived clients from the registry; None when the provider is not configured
+        twilio = sms_clients.get_client('twilio')
+        sns = sms_clients.get_client('sns')
+        twilio_available = twilio is not None
+        aws_available = sns is not None
+
+        logger.info(f"Twilio available: {twilio_available}")
+
+        twilio_exception = None
+        aws_exception = None
+    
+        # Try Twilio first if available
+        twilio_breaker = get_breaker('twilio')
+        if twilio_available and not twilio_breaker.allow_request():
+            twilio_exception = CircuitOpenError("circuit open")
+            logger.info("Twilio circuit open, going straight to AWS")
+        elif twilio_available and not _take_send_token('twilio'):
+            twilio_breaker.cancel_request()
+            twilio_exception = Exception("rate limit wait exceeded")
+        elif twilio_available:
+            started = time.monotonic()
+            try:
+                # Use Twilio
+                client, (_, _, tw_from) = twilio
+                msg = client.messages.create(
+                    body=message_text,
+                    from_=tw_from,
+                    to=recipient
+                )
+                twilio_breaker.record_success(time.monotonic() - started)
+                logger.info(f"SMS sent via Twilio to {recipient}: {msg.sid}")
+                return msg.sid
+
+            except Exception as e:
+                twilio_breaker.record_failure(reason=f"{type(e).__name__}: {e}")
+                twilio_exception = e
+                logger.exception("Twilio SMS failed, attempting fallback to AWS")
+
+        # Fallback to AWS if Twilio wasn't available or failed
+        logger.info(f"AWS available: {aws_available}")
+    
+        sns_breaker = get_breaker('sns')
+        if aws_available and not sns_breaker.allow_request():
+            aws_exception = CircuitOpenError("circuit open")
+            logger.info("AWS SNS circuit open, not trying it")
+        elif aws_available and not _take_send_token('sns'):
+            sns_breaker.cancel_request()
+            aws_exception = Exception("rate limit wait exceeded")
+        elif aws_available:
+            started = time.monotonic()
+            try:
+                # Use AWS SNS
+                sns_client, _ = sns
+
+                response = sns_client.publish(
+                    PhoneNumber=recipient,
+                    Message=message_text,
+                    MessageAttributes={
+                        'AWS.SNS.SMS.SMSType': {
+                            'DataType': 'String',
+                            'StringValue': 'Transactional'
+                        }
+                    }
+                )
+                message_id = response.get('MessageId', 'unknown')
+                sns_breaker.record_success(time.monotonic() - started)
+                logger.info(f"SMS sent via AWS SNS to {recipient}: {message_id}")
+                return message_id
+
+            except Exception as e:
+                sns_breaker.record_failure(reason=f"{type(e).__name__}: {e}")
+                aws_exception = e
+                logger.exception("AWS SNS SMS failed")
+
+        # If neither service is available or both failed, surface the real errors for debugging
+        if not twilio_available and not aws_available:
+            logger.error(
+                "No SMS service configured. Twilio available=%s, AWS available=%s. Message not sent to %s",
+                twilio_available,
+                aws_available,
+                recipient,
+            )
+            raise Exception("No SMS service configured or available")
+
+        # If services were configured but both attempts failed, raise combined error with short messages
+        errs = []
+        if twilio_exception:
+            errs.append(f"Twilio error: {type(twilio_exception).__name__}: {str(twilio_exception)}")
+        if aws_exception:
+            errs.append(f"AWS error: {type(aws_exception).__name__}: {str(aws_exception)}")
+
+        combined = "; ".join(errs) if errs else "Unknown error sending SMS"
+        logger.error("SMS sending failed for %s: %s", recipient, combined)
+        raise Exception(f"SMS sending failed: {combined}")
+
+
+class BrevoEmailBackend(BaseEmailBackend):
+    def send_email(self, receiver_email, subject, html_content):
+        api_key = settings.BREVO_API_KEY
+        sender_email = settings.BREVO_API_EMAIL
+        if not api_key or not sender_email:
+            raise Exception("Brevo API credentials not configured")
+
+        configuration = sib_api_v3_sdk.Configuration()
+        configuration.api_key['api-key'] = api_key
+        api_instance = TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+        email = SendSmtpEmail(
+            sender={"email": sender_email, "name": "MedAssist"},
+            to=[{"email": receiver_email}],
+            subject=subject,
+            html_content=html_content
+        )
+        api_instance.send_transac_email(email)
+
+
+class StandInMixin:
+    """Simulated provider behaviour: a fixed latency and a random failure rate."""
+
+    def simulate_provider(self):
+        latency_ms = settings.NOTIFICATION_STANDIN_LATENCY_MS
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        if random.random() < settings.NOTIFICATION_STANDIN_FAILURE_RATE:
+            raise Exception("Simulated provider failure")
+
+
+class LocMemSMSBackend(StandInMixin, BaseSMSBackend):
+    """Keeps sent SMS in `LocMemSMSBackend.outbox` (shared by the whole process)."""
+    outbox = []
+    _lock = threading.Lock()
+
+    def send_sms(self, message_text, recipient):
+        self.simulate_provider()
+        message_id = f"locmem-{uuid.uuid4().hex}"
+        with self._lock:
+            self.outbox.append({'id': message_id, 'to': recipient, 'body': message_text})
+        return message_id
+
+
+class LocMemEmailBackend(StandInMixin, BaseEmailBackend):
+    """Keeps sent emails in `LocMemEmailBackend.outbox` (shared by the whole process)."""
+    outbox = []
+    _lock = threading.Lock()
+
+    def send_email(self, receiver_email, subject, html_content):
+        self.simulate_provider()
+        with self._lock:
+            self.outbox.append({'to': receiver_email, 'subject': subject, 'html': html_content})
+
+
+_file_lock = threading.Lock()
+
+
+def _append_jsonl(record):
+    with _file_lock, open(settings.NOTIFICATION_FILE_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+class FileSMSBackend(StandInMixin, BaseSMSBackend):
+    """Appends each SMS as a JSON line to NOTIFICATION_FILE_PATH."""
+
+    def send_sms(self, message_text, recipient):
+        self.simulate_provider()
+        message_id = f"file-{uuid.uuid4().hex}"
+        _append_jsonl({
+            'channel': 'sms', 'id': message_id, 'to': recipient, 'body': message_text,
+            'sent_at': timezone.now().isoformat(),
+        })
+        return message_id
+
+
+class FileEmailBackend(StandInMixin, BaseEmailBackend):
+    """Appends each email as a JSON line to NOTIFICATION_FILE_PATH."""
+
+    def send_email(self, receiver_email, subject, html_content):
+        self.simulate_provider()
+        _append_jsonl({
+            'channel': 'email', 'to': receiver_email, 'subject': subject, 'html': html_content,
+            'sent_at': timezone.now().isoformat(),
+        })
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _get_backend(path):
+    backend = _backends.get(path)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(path)
+            if backend is None:
+                backend = import_string(path)()
+                _backends[path] = backend
+    return backend
+
+
+def get_sms_backend():
+    return _get_backend(settings.SMS_BACKEND)
+
+
+def get_email_backend():
+    return _get_backend(settings.NOTIFICATION_EMAIL_BACKEND)
@@ -0,0 +1,67 @@
+"""
+Per-provider token buckets for outbound SMS.
+
+Each provider gets a bucket refilled at its allowed messages-per-second rate, holding at most
+`burst` tokens (one second's worth by default). The provider SMS backend takes a token
+before calling a provider, so concurrent senders in a process never exceed that rate and
+we do not trigger the provider's 429 responses. The buckets are per process; bulk sending
+is kept to one process by the dispatch lease (accounts.scheduler.run_dispatcher_if_leader).
+"""
+from django.conf import settings
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token now if one is available, else return the seconds until one will be."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """Block until a token is taken. Returns False if that would take longer than `timeout`."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self._reserve()
+            if wait == 0:
+                return True
+            if deadline is not None and self._clock() + wait > deadline:
+                return False
+            self._sleep(wait)
+
+
+_lock = threading.Lock()
+_buckets = {}
+
+
+def get_bucket(provider):
+    """The process-wide bucket for `provider` at its SMS_RATE_LIMITS rate, or None if unlimited."""
+    rate = settings.SMS_RATE_LIMITS.get(provider)
+    if not rate:
+        return None
+    key = (provider, rate)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.setdefault(key, TokenBucket(rate))
+    return bucket
+
+
+def reset():
+    with _lock:
+        _buckets.clear()
@@ -0,0 +1,166 @@
+from accounts.models import (
+    Prescription, TakenDose, ArchivedPrescription, ArchivedTakenDose, MedicationReminder, ReminderDailySummary,
+)
+from collections import Counter
+from datetime import datetime, timedelta, time as dt_time
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger('accounts.cron')
+
+
+def archive_expired_prescriptions(now=None, batch_size=None):
+    """
+    Move expired prescriptions and their taken doses into the archive tables.
+
+    Works in chunks of `batch_size` prescriptions, each in its own transaction, using
+    bulk inserts and set-based deletes (reminders and dose slots cascade in the same
+    statement-per-table fashion). Returns the number of prescriptions archived.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.PRESCRIPTION_ARCHIVE_BATCH_SIZE
+    archived = 0
+
+    while True:
+        ids = list(
+            Prescription.objects.filter(expires_at__lte=now)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+
+        with transaction.atomic():
+            ArchivedPrescription.objects.bulk_create(
+                [
+                    ArchivedPrescription(original_id=row.pop('id'), **row)
+                    for row in Prescription.objects.filter(id__in=ids).values(
+                        'id', 'doctor_id', 'patient_id', 'medicines', 'duration_days', 'created_at', 'expires_at',
+                    )
+                ],
+                ignore_conflicts=True,
+            )
+            archive_ids = dict(
+                ArchivedPrescription.objects.filter(original_id__in=ids).values_list('original_id', 'id')
+            )
+
+            doses = []
+            for prescription_id, medicine_name, taken_at, scheduled_time in (
+                TakenDose.objects.filter(prescription_id__in=ids)
+                .values_list('prescription_id', 'medicine_name', 'taken_at', 'scheduled_time')
+                .iterator(chunk_size=1000)
+            ):
+                doses.append(ArchivedTakenDose(
+                    prescription_id=archive_ids[prescription_id],
+                    medicine_name=medicine_name,
+                    taken_at=taken_at,
+                    scheduled_time=scheduled_time,
+                ))
+                if len(doses) >= 1000:
+                    ArchivedTakenDose.objects.bulk_create(doses)
+                    doses = []
+            ArchivedTakenDose.objects.bulk_create(doses)
+
+            # Reminders cascade with the prescription; keep their per-day counts
+            _summarize_reminders(MedicationReminder.objects.filter(prescription_id__in=ids))
+            Prescription.objects.filter(id__in=ids).delete()
+
+        archived += len(ids)
+
+    if archived:
+        logger.info(f"Archived {archived} expired prescriptions")
+    return archived
+
+
+def _summarize_reminders(queryset):
+    """Add the given reminder rows to the per-day summaries. Must run inside a transaction."""
+    counts = Counter()
+    for patient_id, medicine_name, sent_at in (
+        queryset.values_list('prescription__patient_id', 'medicine_name', 'sent_at').iterator(chunk_size=1000)
+    ):
+        counts[(patient_id, medicine_name, timezone.localtime(sent_at).date())] += 1
+    if not counts:
+        return
+
+    # Insert missing summary rows, then lock and increment, so concurrent runs add up correctly
+    ReminderDailySummary.objects.bulk_create(
+        [
+            ReminderDailySummary(patient_id=patient_id, medicine_name=name, day=day)
+            for patient_id, name, day in counts
+        ],
+        ignore_conflicts=True,
+    )
+    changed = []
+    for row in ReminderDailySummary.objects.select_for_update().filter(
+        patient_id__in={key[0] for key in counts},
+        day__in={key[2] for key in counts},
+    ):
+        n = counts.get((row.patient_id, row.medicine_name, row.day))
+        if n:
+            row.count += n
+            changed.append(row)
+    ReminderDailySummary.objects.bulk_update(changed, ['count'])
+
+
+def compact_medication_reminders(now=None, batch_size=None):
+    """
+    Collapse reminder rows older than MEDICATION_REMINDER_RETENTION_DAYS into daily summaries.
+
+    Rows are folded and deleted in chunks of `batch_size`, each in its own transaction. The
+    horizon never reaches into the reminder scan's catch-up window, whose duplicate check
+    still needs the raw rows. Returns the number of rows compacted.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.MEDICATION_REMINDER_COMPACT_BATCH_SIZE
+    horizon = max(
+        timedelta(days=settings.MEDICATION_REMINDER_RETENTION_DAYS),
+        timedelta(
+            hours=settings.MEDICATION_REMINDER_CATCHUP_HOURS,
+            minutes=settings.MEDICATION_REMINDER_GRACE_MINUTES,
+        ),
+    )
+    cutoff = now - horizon
+    compacted = 0
+
+    while True:
+        ids = list(
+            MedicationReminder.objects.filter(sent_at__lt=cutoff)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+
+        with transaction.atomic():
+            _summarize_reminders(MedicationReminder.objects.filter(id__in=ids))
+            MedicationReminder.objects.filter(id__in=ids).delete()
+
+        compacted += len(ids)
+
+    if compacted:
+        logger.info(f"Compacted {compacted} medication reminders older than {cutoff:%Y-%m-%d}")
+    return compacted
+
+
+def reminder_counts(patient, start_date, end_date):
+    """Reminders sent to `patient` per medicine between two dates (inclusive), compacted or not."""
+    counts = Counter()
+    for name, total in (
+        ReminderDailySummary.objects.filter(patient=patient, day__gte=start_date, day__lte=end_date)
+        .values_list('medicine_name')
+        .annotate(total=Sum('count'))
+    ):
+        counts[name] += total
+
+    start = timezone.make_aware(datetime.combine(start_date, dt_time()))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), dt_time()))
+    for name, total in (
+        MedicationReminder.objects.filter(prescription__patient=patient, sent_at__gte=start, sent_at__lt=end)
+        .values_list('medicine_name')
+        .annotate(total=Count('id'))
+    ):
+        counts[name] += total
+    return dict(counts)
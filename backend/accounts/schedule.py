@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, time as dt_time
+from django.utils import timezone
+
+# Human-friendly fixed times for common daily frequencies
+FIXED_TIMES_MAP = {
+    'once-daily': ['08:00'],
+    'twice-daily': ['08:00', '20:00'],
+    'three-times-daily': ['08:00', '14:00', '20:00'],
+    'four-times-daily': ['06:00', '12:00', '18:00', '00:00'],
+}
+
+# Interval-based frequencies, in hours. Anything unknown falls back to daily.
+INTERVAL_HOURS_MAP = {
+    'every-4-hours': 4,
+    'every-6-hours': 6,
+    'every-8-hours': 8,
+    'every-12-hours': 12,
+    'weekly': 24 * 7,
+    'monthly': 24 * 30,
+    'every-30-minutes': 0.5,
+}
+
+# Width of the medicine_name columns (PrescriptionMedicine, DoseSlot, TakenDose, ...)
+MEDICINE_NAME_MAX_LENGTH = 100
+
+
+def parse_duration_days(duration_str):
+    """Return the number of days a medicine runs for, or None for 'as-needed'."""
+    if duration_str == 'ongoing':
+        return 365
+    if duration_str == 'as-needed':
+        return None
+    try:
+        return int(duration_str.split('-')[0]) if '-' in duration_str else 7
+    except ValueError:
+        return 7
+
+
+def parse_medicine(medicine):
+    """
+    Parse one entry of `Prescription.medicines` into typed schedule fields.
+
+    Fixed-time frequencies become minute-of-day offsets, everything else an interval in
+    minutes. The keys match the columns of `PrescriptionMedicine`.
+    """
+    # Entries come from free-text model output; coerce whatever arrived to strings
+    frequency = str(medicine.get('frequency') or '')
+    duration = str(medicine.get('duration', '7-days') or '7-days')
+    duration_days = parse_duration_days(duration)
+
+    fixed_offsets = []
+    interval_minutes = None
+    if frequency in FIXED_TIMES_MAP:
+        for t in FIXED_TIMES_MAP[frequency]:
+            hour, minute = map(int, t.split(':'))
+            fixed_offsets.append(hour * 60 + minute)
+    else:
+        interval_minutes = int(INTERVAL_HOURS_MAP.get(frequency, 24) * 60)
+
+    return {
+        # Same width as every medicine_name column, so the names always match across tables
+        'name': str(medicine.get('name') or '')[:MEDICINE_NAME_MAX_LENGTH],
+        'dosage': str(medicine.get('dosage') or ''),
+        'frequency': frequency,
+        'duration': duration,
+        'interval_minutes': interval_minutes,
+        'fixed_offsets': fixed_offsets,
+        'duration_days': duration_days,
+        'as_needed': duration_days is None or frequency == 'as-needed',
+    }
+
+
+class CompiledSchedule:
+    """
+    A medicine's dose times compiled into `anchor + cycle * period + offset`.
+
+    Fixed-time frequencies have a one-day period anchored at local midnight with one offset
+    per clock time; interval frequencies have a single zero offset and the interval as period.
+    Slot timestamps for any window come from integer arithmetic on the cycle number, so no
+    caller ever has to walk the schedule from `created_at`.
+    """
+
+    def __init__(self, anchor, period, offsets, start, end, window_minutes):
+        self.anchor = anchor
+        self.period = period
+        self.offsets = offsets
+        self.start = start
+        self.end = end
+        self.window_minutes = window_minutes
+
+    def slots_between(self, start, end):
+        """Return the sorted dose times t with start <= t < end (clipped to the schedule's lifetime)."""
+        lo = max(start, self.start)
+        hi = min(end, self.end)
+        if lo >= hi:
+            return []
+        first_cycle = max(0, (lo - self.anchor - self.offsets[-1]) // self.period)
+        last_cycle = (hi - self.anchor) // self.period
+        return [
+            t
+            for t in (
+                self.anchor + cycle * self.period + offset
+                for cycle in range(first_cycle, last_cycle + 1)
+                for offset in self.offsets
+            )
+            if lo <= t < hi
+        ]
+
+    def all_slots(self, until=None):
+        """Every dose time, stopping before `until` (e.g. the prescription's expiry) if given."""
+        return self.slots_between(self.start, min(self.end, until) if until else self.end)
+
+
+def compile_schedule(created_at, interval_minutes, fixed_offsets, duration_days):
+    """Compile a parsed medicine schedule (see `parse_medicine`) into a `CompiledSchedule`."""
+    end_time = created_at + timedelta(days=duration_days)
+
+    if fixed_offsets:
+        # if created at/after noon, start next day
+        noon = dt_time(12, 0)
+        if created_at.time() >= noon:
+            day_start = (created_at + timedelta(days=1)).date()
+        else:
+            day_start = created_at.date()
+        anchor = timezone.make_aware(datetime.combine(day_start, dt_time()))
+        # detection window: ±15 minutes for clock-based schedules
+        return CompiledSchedule(
+            anchor=anchor,
+            period=timedelta(days=1),
+            offsets=sorted(timedelta(minutes=offset) for offset in fixed_offsets),
+            start=anchor,
+            # Don't schedule beyond prescription end
+            end=min(end_time, anchor + timedelta(days=duration_days)),
+            window_minutes=15,
+        )
+
+    window_minutes = max(1, interval_minutes // 4)
+    window_minutes = min(window_minutes, 15)
+    return CompiledSchedule(
+        anchor=created_at,
+        period=timedelta(minutes=interval_minutes),
+        offsets=[timedelta()],
+        start=created_at,
+        end=end_time,
+        window_minutes=window_minutes,
+    )
+
+
+def expand_dose_times(created_at, medicine):
+    """Yield every (scheduled_time, window_minutes) for a raw medicine dict; nothing if as-needed."""
+    parsed = parse_medicine(medicine)
+    if parsed['as_needed']:
+        return
+    schedule = compile_schedule(
+        created_at,
+        parsed['interval_minutes'],
+        parsed['fixed_offsets'],
+        parsed['duration_days'],
+    )
+    for scheduled_time in schedule.all_slots():
+        yield scheduled_time, schedule.window_minutes
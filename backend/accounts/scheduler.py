@@ -1,10 +1,118 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
-from accounts.cron import send_medication_reminders
+from accounts.cron import next_reminder_due, reminder_job_name, send_medication_reminders
+from accounts.dispatcher import DISPATCH_JOB, dispatch_reminders
+from accounts import sms_clients
+from accounts.leader import acquire_lease, release_lease
+from accounts.wakeup import add_wakeup_callback
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+import atexit
 import logging
 
 logger = logging.getLogger(__name__)
 
+REMINDER_JOB_ID = 'send_medication_reminders'
+DISPATCH_JOB_ID = 'dispatch_reminders'
+
+
+def run_reminders_if_leader(shard=None):
+    """
+    Run the reminder job (or one shard of it) only in the process holding its lease.
+
+    The lease is renewed between batches, so a long catch-up run keeps it. Returns None if
+    another process holds the lease, otherwise the number of reminders queued.
+    """
+    name = reminder_job_name(shard)
+    ttl = settings.MEDICATION_REMINDER_LEASE_SECONDS
+    close_old_connections()
+    try:
+        if not acquire_lease(name, ttl):
+            return None
+        return send_medication_reminders(shard, renew_lease=lambda: acquire_lease(name, ttl))
+    finally:
+        close_old_connections()
+
+
+def run_dispatcher_if_leader(concurrency=None):
+    """
+    Send whatever is in the reminder outbox, only in the process holding the dispatch lease.
+
+    SMS rate limits are enforced per process, so a single sender keeps the whole deployment
+    within SMS_RATE_LIMITS. Returns None if another process holds the lease, otherwise the
+    number of SMS sent.
+    """
+    ttl = settings.MEDICATION_REMINDER_LEASE_SECONDS
+    close_old_connections()
+    try:
+        if not acquire_lease(DISPATCH_JOB, ttl):
+            return None
+        return dispatch_reminders(concurrency=concurrency, renew_lease=lambda: acquire_lease(DISPATCH_JOB, ttl))
+    finally:
+        close_old_connections()
+
+
+def seconds_until_next_run(shard=None, max_seconds=None):
+    """Seconds until the next dose slot is due for a reminder, capped at `max_seconds`."""
+    max_seconds = max_seconds if max_seconds is not None else settings.MEDICATION_REMINDER_TICK_SECONDS
+    try:
+        due = next_reminder_due(shard)
+    except Exception as e:
+        logger.warning(f"Could not compute next reminder deadline: {e}")
+        return max_seconds
+    finally:
+        close_old_connections()
+    if due is None:
+        return max_seconds
+    return min(max(0.0, (due - timezone.now()).total_seconds()), max_seconds)
+
+
+def _release(name):
+    try:
+        release_lease(name)
+    except Exception as e:
+        logger.warning(f"Could not release lease {name}: {e}")
+
+
+def release_reminder_lease(shard=None):
+    _release(reminder_job_name(shard))
+
+
+def release_dispatch_lease():
+    _release(DISPATCH_JOB)
+
+
+def _shutdown(scheduler):
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    release_reminder_lease()
+    release_dispatch_lease()
+
+
+def _run_and_reschedule(scheduler):
+    """Run the job, then sleep until the next slot is due (at most one tick)."""
+    try:
+        queued = run_reminders_if_leader()
+    except Exception as e:
+        logger.error(f"Reminder run failed: {e}")
+        queued = None
+    delay = seconds_until_next_run() if queued is not None else settings.MEDICATION_REMINDER_TICK_SECONDS
+    scheduler.modify_job(REMINDER_JOB_ID, next_run_time=timezone.now() + timedelta(seconds=delay))
+    if queued:
+        # Deliver right away rather than on the dispatcher's next poll
+        scheduler.modify_job(DISPATCH_JOB_ID, next_run_time=timezone.now())
+
+
+def _wake(scheduler):
+    """Pull the next run forward to (almost) now; bursts of writes coalesce into one run."""
+    job = scheduler.get_job(REMINDER_JOB_ID)
+    soon = timezone.now() + timedelta(seconds=1)
+    if job is not None and (job.next_run_time is None or job.next_run_time > soon):
+        scheduler.modify_job(REMINDER_JOB_ID, next_run_time=soon)
+
+
 def start():
     scheduler = BackgroundScheduler()
     
@@ -15,19 +123,31 @@ def start():
     }
     scheduler.add_jobstore(jobstores['default'], 'default')
     
-    # Run every 1 minute for testing as requested
-    # TODO: Change to 20 minutes after testing: minutes=20
+    # The tick is only an upper bound: each run reschedules itself for the next due slot,
+    # and new prescriptions / taken doses wake it early (accounts.wakeup).
     scheduler.add_job(
-        send_medication_reminders, 
-        'interval', 
-        minutes=1, 
-        id='send_medication_reminders', 
+        _run_and_reschedule,
+        'interval',
+        args=[scheduler],
+        seconds=settings.MEDICATION_REMINDER_TICK_SECONDS,
+        id=REMINDER_JOB_ID,
         replace_existing=True,
         max_instances=1  # Prevent multiple instances running simultaneously
     )
+    scheduler.add_job(
+        run_dispatcher_if_leader,
+        'interval',
+        seconds=settings.REMINDER_DISPATCH_TICK_SECONDS,
+        id=DISPATCH_JOB_ID,
+        replace_existing=True,
+        max_instances=1,
+    )
+    add_wakeup_callback(lambda: _wake(scheduler))
     
     try:
+        sms_clients.warm_up()
         scheduler.start()
+        atexit.register(_shutdown, scheduler)
         logger.info("Scheduler started with MemoryJobStore (no DB persistence)")
     except Exception as e:
         logger.error(f"Error starting scheduler: {e}")
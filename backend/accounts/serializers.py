@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
 from django.contrib.auth import authenticate
-from .models import Profile, DoctorPatient, Record, AudioRecording, ChatMessage, Prescription, Appointment, TakenDose
+from .models import Profile, DoctorPatient, Record, AudioRecording, ChatMessage, Prescription, Appointment, TakenDose, JobRun
 import logging
 
 logger = logging.getLogger(__name__)
@@ -233,7 +233,7 @@ class TakenDoseSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = TakenDose
-        fields = ('id', 'prescription', 'prescription_title', 'medicine_name', 'taken_at')
+        fields = ('id', 'prescription', 'prescription_title', 'medicine_name', 'taken_at', 'scheduled_time')
 
     def get_prescription_title(self, obj):
         doctor_name = obj.prescription.doctor.username
@@ -365,3 +365,16 @@ class LoginSerializer(serializers.Serializer):
         
         data['user'] = user
         return data
+
+
+class JobRunSerializer(serializers.ModelSerializer):
+    """Serializer for periodic job run statistics (staff only)."""
+
+    duration_ms = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = JobRun
+        fields = (
+            'id', 'job', 'started_at', 'finished_at', 'duration_ms', 'prescriptions_scanned', 'slots_evaluated',
+            'queries', 'sms_attempted', 'sms_sent', 'sms_failed', 'error',
+        )
@@ -0,0 +1,99 @@
+"""
+Process-wide, long-lived SMS provider clients.
+
+`send_sms` used to build a new Twilio client / boto3 SNS client (and with it a new HTTP
+session and TLS handshake) for every message. Clients here are built once per process,
+keep their connections alive in pools sized for SMS_CLIENT_POOL_SIZE concurrent sends,
+and are rebuilt only when the credentials in settings change. Both clients are safe to
+share between threads; building them is serialised by a lock.
+"""
+from botocore.config import Config
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+import boto3
+import logging
+import threading
+
+logger = logging.getLogger('accounts.cron')
+
+_lock = threading.Lock()
+# provider -> (credentials the client was built with, client)
+_clients = {}
+
+
+def _twilio_credentials():
+    sid = getattr(settings, 'TWILIO_ACCOUNT_SID', None)
+    token = getattr(settings, 'TWILIO_AUTH_TOKEN', None)
+    from_number = getattr(settings, 'TWILIO_FROM_NUMBER', None)
+    return (sid, token, from_number) if sid and token and from_number else None
+
+
+def _aws_credentials():
+    key = getattr(settings, 'AWS_ACCESS_KEY_ID', None)
+    secret = getattr(settings, 'AWS_SECRET_ACCESS_KEY', None)
+    region = getattr(settings, 'AWS_REGION', None)
+    return (key, secret, region) if key and secret and region else None
+
+
+def _build_twilio(credentials):
+    sid, token, _ = credentials
+    http_client = TwilioHttpClient(pool_connections=True, timeout=settings.SMS_CLIENT_TIMEOUT_SECONDS)
+    http_client.session.mount('https://', HTTPAdapter(pool_maxsize=settings.SMS_CLIENT_POOL_SIZE))
+    return Client(sid, token, http_client=http_client)
+
+
+def _build_sns(credentials):
+    key, secret, region = credentials
+    # A private session: boto3's default session is not safe to build clients from concurrently
+    session = boto3.session.Session(aws_access_key_id=key, aws_secret_access_key=secret, region_name=region)
+    return session.client('sns', config=Config(
+        max_pool_connections=settings.SMS_CLIENT_POOL_SIZE,
+        connect_timeout=settings.SMS_CLIENT_TIMEOUT_SECONDS,
+        read_timeout=settings.SMS_CLIENT_TIMEOUT_SECONDS,
+    ))
+
+
+_PROVIDERS = {
+    'twilio': (_twilio_credentials, _build_twilio),
+    'sns': (_aws_credentials, _build_sns),
+}
+
+
+def get_client(provider):
+    """
+    Return `(client, credentials)` for 'twilio' or 'sns', or None if it is not configured.
+
+    The cached client is reused until the configured credentials differ from the ones it
+    was built with.
+    """
+    read_credentials, build = _PROVIDERS[provider]
+    credentials = read_credentials()
+    if credentials is None:
+        return None
+    cached = _clients.get(provider)
+    if cached is not None and cached[0] == credentials:
+        return cached[1], credentials
+    with _lock:
+        cached = _clients.get(provider)
+        if cached is None or cached[0] != credentials:
+            logger.info(f"Building {provider} SMS client")
+            cached = (credentials, build(credentials))
+            _clients[provider] = cached
+    return cached[1], credentials
+
+
+def warm_up():
+    """Build every configured client up front (call when a worker starts)."""
+    for provider in _PROVIDERS:
+        try:
+            get_client(provider)
+        except Exception as e:
+            logger.warning(f"Could not build {provider} SMS client: {e}")
+
+
+def reset():
+    """Drop all cached clients; the next send builds fresh ones."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,246 @@
+"""
+Encoding stage applied to every outgoing SMS before it reaches a backend.
+
+An SMS is billed per segment. A GSM-7 message fits 160 characters in one segment (153 per
+segment once it is split), but a single character outside the GSM-7 alphabet (a smart
+quote pasted from a word processor, an emoji in a transcription) turns the whole message
+into UCS-2, with 70 (67) characters per segment. `prepare_sms`:
+
+1. Transliterates, character by character, to GSM-7 where no meaning is lost: typographic
+   quotes, dashes and spaces become their ASCII forms, accents not in the GSM alphabet are
+   stripped, and emoji are dropped. Characters with no safe equivalent (Devanagari, "°")
+   are kept, and then the message goes out as UCS-2.
+2. Collapses runs of spaces and blank lines.
+3. Abbreviates common words ("tablets" -> "tabs") only when that saves a segment.
+4. Fits the result to SMS_MAX_SEGMENTS segments: `split_sms` breaks longer texts into
+   numbered messages (at most SMS_MAX_PARTS), `prepare_sms` truncates them.
+"""
+from django.conf import settings
+import logging
+import re
+import unicodedata
+
+logger = logging.getLogger('accounts.cron')
+
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+# Sent as an escape plus the character, so each takes two septets
+GSM7_EXTENDED = set("^{}\\[~]|€\f")
+
+GSM7 = 'GSM-7'
+UCS2 = 'UCS-2'
+# (single-segment limit, per-segment limit once split), in septets / UTF-16 code units
+SEGMENT_LIMITS = {GSM7: (160, 153), UCS2: (70, 67)}
+
+TRANSLITERATIONS = {
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'", '`': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"', '‟': '"', '″': '"', '«': '"', '»': '"',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+    '…': '...', '•': '-', '·': '-', '×': 'x',
+    '\u00a0': ' ', '\u2002': ' ', '\u2003': ' ', '\u2009': ' ', '\u202f': ' ', '\t': ' ',
+    '₹': 'Rs.', '©': '(c)', '®': '(R)', '™': 'TM',
+    '⁄': '/', '\u200b': '', '\u2060': '', '\ufeff': '',
+}
+
+# Emoji and pictographs (incl. flags, tags), dingbats, and emoji variation selectors
+EMOJI_RANGES = [(0x1F000, 0x1FAFF), (0x2600, 0x27BF), (0xFE00, 0xFE0F), (0xE0020, 0xE007F)]
+
+# Word-bounded, applied only when they bring the message down by at least one segment
+ABBREVIATIONS = [
+    (re.compile(r'\bthree times a day\b', re.I), '3x/day'),
+    (re.compile(r'\btwice (a day|daily)\b', re.I), '2x/day'),
+    (re.compile(r'\bonce (a day|daily)\b', re.I), '1x/day'),
+    (re.compile(r'\btablets\b'), 'tabs'),
+    (re.compile(r'\btablet\b'), 'tab'),
+    (re.compile(r'\bcapsules\b'), 'caps'),
+    (re.compile(r'\bcapsule\b'), 'cap'),
+    (re.compile(r'\bminutes\b'), 'min'),
+    (re.compile(r'\bhours\b'), 'hrs'),
+    (re.compile(r'\bappointment\b'), 'appt'),
+    (re.compile(r'\bPlease\b'), 'Pls'),
+    (re.compile(r'\bplease\b'), 'pls'),
+]
+
+ELLIPSIS = '...'
+
+
+def is_gsm7(text):
+    return all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text)
+
+
+def _unit_sizes(text, encoding):
+    """Size of each character in septets (GSM-7) or UTF-16 code units (UCS-2)."""
+    if encoding == GSM7:
+        return [2 if c in GSM7_EXTENDED else 1 for c in text]
+    return [2 if ord(c) > 0xFFFF else 1 for c in text]
+
+
+def segment_info(text):
+    """Return `(encoding, segments)` for `text` as it would be sent."""
+    encoding = GSM7 if is_gsm7(text) else UCS2
+    sizes = _unit_sizes(text, encoding)
+    single, per_segment = SEGMENT_LIMITS[encoding]
+    if sum(sizes) <= single:
+        return encoding, 1 if sizes else 0
+    # Escape pairs and surrogate pairs are never split across segments
+    segments, used = 1, 0
+    for size in sizes:
+        if used + size > per_segment:
+            segments += 1
+            used = 0
+        used += size
+    return encoding, segments
+
+
+def segment_count(text):
+    return segment_info(text)[1]
+
+
+def compact_whitespace(text):
+    """Collapse runs of spaces, trim every line and keep at most one blank line in a row."""
+    lines = [re.sub(r'[ \t\u00a0]+', ' ', line).strip() for line in text.replace('\r\n', '\n').split('\n')]
+    text = '\n'.join(lines)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def _is_emoji(c):
+    return any(low <= ord(c) <= high for low, high in EMOJI_RANGES)
+
+
+def _transliterate_char(c):
+    if c in GSM7_BASIC or c in GSM7_EXTENDED:
+        return c
+    if c in TRANSLITERATIONS:
+        return TRANSLITERATIONS[c]
+    if _is_emoji(c):
+        return ''
+    # Accented letters, full-width forms, ligatures, fractions: use the base characters if
+    # those are GSM-7
+    base = ''.join(
+        TRANSLITERATIONS.get(d, d) for d in unicodedata.normalize('NFKD', c) if not unicodedata.combining(d)
+    )
+    if base and is_gsm7(base):
+        return base
+    return c
+
+
+def to_gsm7(text):
+    """
+    Replace every character of `text` that has a safe GSM-7 equivalent; others are kept.
+
+    Combining marks and zero-width joiners are dropped only after a GSM-7 character (a
+    decomposed accent, an emoji sequence); in other scripts they are part of the letter.
+    """
+    converted = []
+    for c in unicodedata.normalize('NFC', text):
+        if unicodedata.combining(c) or c in ('\u200c', '\u200d'):
+            if not converted or is_gsm7(converted[-1][-1:]):
+                continue
+            converted.append(c)
+        else:
+            converted.append(_transliterate_char(c))
+    return ''.join(converted)
+
+
+def abbreviate(text):
+    for pattern, replacement in ABBREVIATIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _fit(text, max_segments, prefix='', suffix=''):
+    """Length of the longest head of `text` that fits `max_segments` between prefix and suffix."""
+    encoding = GSM7 if is_gsm7(prefix + text + suffix) else UCS2
+    single, per_segment = SEGMENT_LIMITS[encoding]
+    budget = single if max_segments == 1 else per_segment * max_segments
+    budget -= sum(_unit_sizes(prefix + suffix, encoding))
+    cut, used = 0, 0
+    for size in _unit_sizes(text, encoding):
+        if used + size > budget:
+            break
+        used += size
+        cut += 1
+    # Escape / surrogate pairs at segment boundaries can leave a segment short; back off
+    while cut and segment_count(prefix + text[:cut] + suffix) > max_segments:
+        cut -= 1
+    return cut
+
+
+def _break_at_boundary(text, cut):
+    """Move `cut` back to a line or word break unless that would waste much of the message."""
+    if cut >= len(text):
+        return cut
+    line = text.rfind('\n', 0, cut + 1)
+    if line > cut * 0.5:
+        return line
+    word = text.rfind(' ', 0, cut + 1)
+    if word > cut * 0.8:
+        return word
+    return cut
+
+
+def truncate_to_segments(text, max_segments):
+    """Cut `text` at a word boundary, ending in "...", so it fits `max_segments` segments."""
+    if segment_count(text) <= max_segments:
+        return text
+    head = text[:_break_at_boundary(text, _fit(text, max_segments, suffix=ELLIPSIS))]
+    return head.rstrip(' \n.,;:-') + ELLIPSIS
+
+
+def encode_sms(text):
+    """Steps 1-3 of the module docstring: `text` rewritten to need as few segments as possible."""
+    encoded = compact_whitespace(to_gsm7(text))
+    abbreviated = abbreviate(encoded)
+    if segment_count(abbreviated) < segment_count(encoded):
+        encoded = abbreviated
+    return encoded
+
+
+def _log(text, parts):
+    if parts != [text]:
+        encoding = segment_info(''.join(parts))[0]
+        logger.info(
+            f"SMS re-encoded: {len(text)} -> {sum(len(part) for part in parts)} chars in "
+            f"{len(parts)} message(s), {encoding}, {sum(segment_count(part) for part in parts)} segment(s)"
+        )
+
+
+def prepare_sms(text, max_segments=None):
+    """`text` encoded and truncated to fit one message of `max_segments` segments."""
+    max_segments = max_segments or settings.SMS_MAX_SEGMENTS
+    prepared = truncate_to_segments(encode_sms(text), max_segments)
+    _log(text, [prepared])
+    return prepared
+
+
+def split_sms(text, max_segments=None, max_parts=None):
+    """
+    `text` encoded and split into messages of at most `max_segments` segments each, broken
+    at line or word boundaries and numbered "(1/3) ", "(2/3) ", ... A text needing more than
+    `max_parts` (SMS_MAX_PARTS) messages has its last one truncated.
+    """
+    max_segments = max_segments or settings.SMS_MAX_SEGMENTS
+    max_parts = max_parts or settings.SMS_MAX_PARTS
+    encoded = encode_sms(text)
+    if segment_count(encoded) <= max_segments:
+        _log(text, [encoded])
+        return [encoded]
+
+    # Reserve room for the widest numbering prefix
+    numbering = f"({max_parts}/{max_parts}) "
+    chunks = []
+    rest = encoded
+    while rest and len(chunks) < max_parts:
+        if len(chunks) == max_parts - 1 and segment_count(numbering + rest) > max_segments:
+            logger.warning(f"SMS longer than {max_parts} messages of {max_segments} segments; truncating")
+            head = rest[:_break_at_boundary(rest, _fit(rest, max_segments, prefix=numbering, suffix=ELLIPSIS))]
+            chunks.append(head.rstrip(' \n.,;:-') + ELLIPSIS)
+            break
+        cut = max(1, _break_at_boundary(rest, _fit(rest, max_segments, prefix=numbering)))
+        chunks.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    parts = [f"({n}/{len(chunks)}) {chunk}" for n, chunk in enumerate(chunks, 1)]
+    _log(text, parts)
+    return parts
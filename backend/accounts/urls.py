@@ -17,6 +17,10 @@ from .views import (
     PatientAppointmentsView,
     DoctorAppointmentsView,
     PatientMedicationLogsView,
+    PatientAdherenceView,
+    DoctorPatientAdherenceView,
+    JobRunsView,
+    SMSHealthView,
     PatientAIChatView,
     DoctorSendPrescriptionsSMSView,
     RequestPasswordResetView,
@@ -46,8 +50,12 @@ urlpatterns = [
     path('doctor/appointments/', DoctorAppointmentsView.as_view(), name='doctor_appointments'),
     path('doctor/appointments/<int:appointment_id>/', DoctorAppointmentsView.as_view(), name='doctor_appointment_detail'),
     path('patient/medication-logs/', PatientMedicationLogsView.as_view(), name='patient_medication_logs'),
+    path('patient/adherence/', PatientAdherenceView.as_view(), name='patient_adherence'),
+    path('doctor/patients/<int:patient_id>/adherence/', DoctorPatientAdherenceView.as_view(), name='doctor_patient_adherence'),
     path('doctor/patients/<int:patient_id>/prescriptions/send-sms/', DoctorSendPrescriptionsSMSView.as_view(), name='doctor_send_prescriptions_sms'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('admin/job-runs/', JobRunsView.as_view(), name='job_runs'),
+    path('admin/sms-health/', SMSHealthView.as_view(), name='sms_health'),
     # Password reset endpoints
     path('password-reset/request/', RequestPasswordResetView.as_view(), name='password_reset_request'),
     path('password-reset/verify/', VerifyOTPView.as_view(), name='password_reset_verify'),
@@ -1,27 +1,28 @@
 import re
-import boto3
-from twilio.rest import Client
 from django.conf import settings
 import logging
 import secrets
-import sib_api_v3_sdk
 from sib_api_v3_sdk.rest import ApiException
-from sib_api_v3_sdk.api.transactional_emails_api import TransactionalEmailsApi
-from sib_api_v3_sdk.models.send_smtp_email import SendSmtpEmail
+from .notification_backends import get_email_backend, get_sms_backend
+from .sms_encoding import split_sms
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logger = logging.getLogger('accounts.cron')
 
 def send_sms(message_text: str, recipient: str) -> str:
     """
-    Sends SMS via available service (Twilio or AWS SNS).
-    Priority: Twilio if available, otherwise AWS SNS if available.
+    Sends SMS through the configured SMS_BACKEND (by default Twilio, falling back to
+    AWS SNS; see accounts.notification_backends). The text is first re-encoded to fit as
+    few segments as possible; a text longer than SMS_MAX_SEGMENTS segments is sent as
+    several numbered messages (see accounts.sms_encoding).
 
     Args:
         message_text (str): The SMS text content.
         recipient (str): The recipient's phone number.
 
     Returns:
-        str: Message SID/MessageId upon successful send.
+        str: Message SID/MessageId upon successful send; comma-separated when the text
+        went out as several messages.
     """
 
     # Normalize phone number format
@@ -32,97 +33,47 @@ def send_sms(message_text: str, recipient: str) -> str:
 
     logger.info(f"Attempting to send SMS to {recipient}: {message_text[:50]}...")
 
-    # Check if Twilio credentials are available using direct attribute access
-    try:
-        tw_sid = settings.TWILIO_ACCOUNT_SID
-        tw_auth = settings.TWILIO_AUTH_TOKEN
-        tw_from = settings.TWILIO_FROM_NUMBER
-        twilio_available = bool(tw_sid and tw_auth and tw_from)
-    except Exception:
-        twilio_available = False
+    backend = get_sms_backend()
+    return ','.join(backend.send_sms(part, recipient) for part in split_sms(message_text))
 
-    logger.info(f"Twilio available: {twilio_available}")
 
-    twilio_exception = None
-    aws_exception = None
-    
-    # Try Twilio first if available
-    if twilio_available:
-        try:
-            # Use Twilio
-            client = Client(tw_sid, tw_auth)
-            msg = client.messages.create(
-                body=message_text,
-                from_=tw_from,
-                to=recipient
-            )
-            logger.info(f"SMS sent via Twilio to {recipient}: {msg.sid}")
-            return msg.sid
-
-        except Exception as e:
-            twilio_exception = e
-            logger.exception("Twilio SMS failed, attempting fallback to AWS")
-
-    # Fallback to AWS if Twilio wasn't available or failed
-    # Check if AWS credentials are available
-    try:
-        aws_key = settings.AWS_ACCESS_KEY_ID
-        aws_secret = settings.AWS_SECRET_ACCESS_KEY
-        aws_region = settings.AWS_REGION
-        aws_available = bool(aws_key and aws_secret and aws_region)
-    except Exception:
-        aws_available = False
-
-    logger.info(f"AWS available: {aws_available}")
-    
-    if aws_available:
-        try:
-            # Use AWS SNS
-            sns_client = boto3.client(
-                "sns",
-                aws_access_key_id=aws_key,
-                aws_secret_access_key=aws_secret,
-                region_name=aws_region
-            )
-
-            response = sns_client.publish(
-                PhoneNumber=recipient,
-                Message=message_text,
-                MessageAttributes={
-                    'AWS.SNS.SMS.SMSType': {
-                        'DataType': 'String',
-                        'StringValue': 'Transactional'
-                    }
-                }
-            )
-            message_id = response.get('MessageId', 'unknown')
-            logger.info(f"SMS sent via AWS SNS to {recipient}: {message_id}")
-            return message_id
-
-        except Exception as e:
-            aws_exception = e
-            logger.exception("AWS SNS SMS failed")
-
-    # If neither service is available or both failed, surface the real errors for debugging
-    if not twilio_available and not aws_available:
-        logger.error(
-            "No SMS service configured. Twilio available=%s, AWS available=%s. Message not sent to %s",
-            twilio_available,
-            aws_available,
-            recipient,
-        )
-        raise Exception("No SMS service configured or available")
-
-    # If services were configured but both attempts failed, raise combined error with short messages
-    errs = []
-    if twilio_exception:
-        errs.append(f"Twilio error: {type(twilio_exception).__name__}: {str(twilio_exception)}")
-    if aws_exception:
-        errs.append(f"AWS error: {type(aws_exception).__name__}: {str(aws_exception)}")
-
-    combined = "; ".join(errs) if errs else "Unknown error sending SMS"
-    logger.error("SMS sending failed for %s: %s", recipient, combined)
-    raise Exception(f"SMS sending failed: {combined}")
+def send_sms_batch(messages, concurrency=None, on_result=None):
+    """
+    Sends many SMS in parallel on a worker pool, each through `send_sms` (so provider rate
+    limits, circuit breakers and fallback all apply per message).
+
+    Args:
+        messages (list): (message_text, recipient) pairs.
+        concurrency (int): Parallel sends; defaults to SMS_CLIENT_POOL_SIZE.
+        on_result (callable): Called as on_result(index, result) in the calling thread as
+            each message finishes, e.g. to record progress before the batch is done.
+
+    Returns:
+        list: One dict per message, in input order: {'recipient', 'status' ('sent' or
+        'failed'), 'message_id', 'error'}.
+    """
+    messages = list(messages)
+    results = [None] * len(messages)
+    if not messages:
+        return results
+    concurrency = concurrency or settings.SMS_CLIENT_POOL_SIZE
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(messages))) as pool:
+        futures = {
+            pool.submit(send_sms, message_text, recipient): index
+            for index, (message_text, recipient) in enumerate(messages)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            recipient = messages[index][1]
+            try:
+                result = {'recipient': recipient, 'status': 'sent', 'message_id': future.result(), 'error': None}
+            except Exception as e:
+                result = {'recipient': recipient, 'status': 'failed', 'message_id': None, 'error': f"{type(e).__name__}: {e}"}
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result)
+    return results
 
 
 def generate_otp():
@@ -132,7 +83,7 @@ def generate_otp():
 
 def send_password_reset_email(receiver_email: str, otp: str) -> bool:
     """
-    Sends a password reset OTP email using Brevo API.
+    Sends a password reset OTP email through the configured NOTIFICATION_EMAIL_BACKEND (Brevo by default).
     
     Args:
         receiver_email (str): The recipient's email address.
@@ -142,13 +93,6 @@ def send_password_reset_email(receiver_email: str, otp: str) -> bool:
         bool: True if email sent successfully, False otherwise.
     """
     try:
-        api_key = settings.BREVO_API_KEY
-        sender_email = settings.BREVO_API_EMAIL
-        
-        if not api_key or not sender_email:
-            logger.error("Brevo API credentials not configured")
-            return False
-        
         html = f"""
         <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
             <h2 style="color: #333;">Password Reset Request</h2>
@@ -163,18 +107,7 @@ def send_password_reset_email(receiver_email: str, otp: str) -> bool:
         </div>
         """
         
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key['api-key'] = api_key
-        api_instance = TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-        
-        email = SendSmtpEmail(
-            sender={"email": sender_email, "name": "MedAssist"},
-            to=[{"email": receiver_email}],
-            subject="Password Reset - Verification Code",
-            html_content=html
-        )
-        
-        response = api_instance.send_transac_email(email)
+        get_email_backend().send_email(receiver_email, "Password Reset - Verification Code", html)
         logger.info(f"Password reset email sent successfully to {receiver_email}")
         return True
         
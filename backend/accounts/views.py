@@ -1,13 +1,15 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User, Group
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.http import JsonResponse
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 import logging
 
 from .serializers import (
@@ -22,6 +24,7 @@ from .serializers import (
     TakenDoseSerializer,
     DoctorBasicSerializer,
     AppointmentSerializer,
+    JobRunSerializer,
 )
 from .models import (
     DoctorPatient, 
@@ -31,9 +34,13 @@ from .models import (
     Prescription, 
     Profile, 
     Appointment, 
-    TakenDose
+    TakenDose,
+    JobRun,
 )
 from .utils import send_sms
+from .circuit_breaker import get_breaker
+from .dose_bitmap import is_slot_taken, load_bitmaps, mark_slots_taken
+from .wakeup import notify_reminder_worker
 from agno.models.cerebras import CerebrasOpenAI
 from agno.agent import Agent
 from backend.settings import CEREBRUS_API_KEY
@@ -414,14 +421,9 @@ class DoctorSendPrescriptionsSMSView(APIView):
         doctor_name = request.user.profile.name or request.user.username
         header = f"Dr. {doctor_name} - Your prescriptions:\n"
         lines.append(header)
-        for p in prescriptions:
-            for m in p.medicines:
-                name = m.get('name', '')
-                dosage = m.get('dosage', '')
-                freq = m.get('frequency', '')
-                duration = m.get('duration', '')
-                if name:  # Only add if medicine has a name
-                    lines.append(f"- {name} {dosage} | {freq} | {duration}")
+        for p in prescriptions.prefetch_related('medicine_items'):
+            for m in p.medicine_items.all():
+                lines.append(f"- {m.name} {m.dosage} | {m.frequency} | {m.duration}")
 
         # Optional notes (append latest notes)
         latest_notes = '\n'.join([p.notes for p in prescriptions if p.notes])
@@ -442,7 +444,8 @@ class DoctorSendPrescriptionsSMSView(APIView):
                 return Response({'error': 'Patient has no phone number'}, status=status.HTTP_400_BAD_REQUEST)
             sid = send_sms(message_text, patient_phone)
             logger.info(f"Prescription SMS sent to patient {patient.id}, SID: {sid}")
-            return Response({'message': 'Sent', 'sid': sid}, status=status.HTTP_200_OK)
+            # Long prescription lists go out as several numbered SMS
+            return Response({'message': 'Sent', 'sid': sid, 'sms_count': len(sid.split(','))}, status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Failed to send prescription SMS to patient {patient.id}: {str(e)}")
             return Response({'error': f'Failed to send SMS: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -475,7 +478,7 @@ class PatientDashboardDataView(APIView):
             doctor_links = doctor_links.filter(doctor_id=doctor_id)
         doctor_ids = list(doctor_links.values_list('doctor_id', flat=True))
         # Prescriptions (medicines)
-        prescriptions = Prescription.objects.filter(patient=request.user, doctor_id__in=doctor_ids).order_by('-created_at')
+        prescriptions = Prescription.objects.active().filter(patient=request.user, doctor_id__in=doctor_ids).order_by('-created_at')
         prescription_data = PrescriptionSerializer(prescriptions, many=True).data
         # Records (both doctor and patient uploaded)
         records = Record.objects.filter(patient=request.user, doctor_id__in=doctor_ids).order_by('-uploaded_at')
@@ -970,121 +973,268 @@ class LogoutView(APIView):
             return Response({'error': f'Invalid token: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
 class PatientMedicationLogsView(APIView):
+    """Pending doses for the patient's active prescriptions, and marking doses as taken.
+
+    Query params (GET):
+      window_hours (optional, default 1, max 168) -> how far ahead to list pending doses.
+    """
     permission_classes = [IsAuthenticated]
+    MAX_WINDOW_HOURS = 24 * 7
 
     def get(self, request):
         if not request.user.groups.filter(name='Patient').exists():
             return Response({'error': 'Only patients can access this'}, status=status.HTTP_403_FORBIDDEN)
-        from datetime import datetime, timedelta
+        try:
+            window_hours = int(request.query_params.get('window_hours', 1))
+        except ValueError:
+            return Response({'error': 'window_hours must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= window_hours <= self.MAX_WINDOW_HOURS:
+            return Response({'error': f'window_hours must be between 1 and {self.MAX_WINDOW_HOURS}'}, status=status.HTTP_400_BAD_REQUEST)
         now = timezone.now()
-        next_hour = now + timedelta(hours=1)
+        window_end = now + timedelta(hours=window_hours)
         
         pending_doses = []
-        prescriptions = Prescription.objects.filter(patient=request.user)
+        prescriptions = list(
+            Prescription.objects.active(now)
+            .filter(patient=request.user)
+            .select_related('doctor__profile')
+            .prefetch_related('medicine_items')
+        )
+
+        # Taken slots are bits in the per-day dose bitmaps; one query covers the whole window
+        taken_bitmaps = load_bitmaps([prescription.id for prescription in prescriptions], now, window_end)
+
         for prescription in prescriptions:
-            if prescription.duration_days and (prescription.created_at + timedelta(days=prescription.duration_days)) < now:
-                continue  # Expired
-            medicines = prescription.medicines
-            for medicine in medicines:
-                name = medicine.get('name')
-                frequency = medicine.get('frequency')
-                duration_str = medicine.get('duration', '7-days')
-                
-                if duration_str == 'ongoing':
-                    duration_days = 365
-                elif duration_str == 'as-needed':
-                    continue
-                else:
-                    duration_days = int(duration_str.split('-')[0]) if '-' in duration_str else 7
-                
-                if frequency == 'once-daily':
-                    interval_hours = 24
-                elif frequency == 'twice-daily':
-                    interval_hours = 12
-                elif frequency == 'three-times-daily':
-                    interval_hours = 8
-                elif frequency == 'four-times-daily':
-                    interval_hours = 6
-                elif frequency == 'every-4-hours':
-                    interval_hours = 4
-                elif frequency == 'every-6-hours':
-                    interval_hours = 6
-                elif frequency == 'every-8-hours':
-                    interval_hours = 8
-                elif frequency == 'every-12-hours':
-                    interval_hours = 12
-                elif frequency == 'weekly':
-                    interval_hours = 24 * 7
-                elif frequency == 'monthly':
-                    interval_hours = 24 * 30
-                elif frequency == 'every-30-minutes':
-                    interval_hours = 0.5
-                elif frequency == 'as-needed':
+            doctor = prescription.doctor
+            prescription_title = f"Prescription by {doctor.profile.name or doctor.username}"
+            for medicine in prescription.medicine_items.all():
+                schedule = medicine.schedule(prescription.created_at)
+                if schedule is None:
                     continue
-                else:
-                    interval_hours = 24
-                
-                start_time = prescription.created_at
-                current_time = start_time
-                end_time = start_time + timedelta(days=duration_days)
-                while current_time < end_time and current_time <= next_hour:
-                    if current_time >= now and current_time <= next_hour:
-                        # Check if already taken
-                        taken = TakenDose.objects.filter(
-                            prescription=prescription,
-                            medicine_name=name,
-                            taken_at__date=current_time.date(),
-                            taken_at__hour=current_time.hour
-                        ).exists()
-                        if not taken:
-                            pending_doses.append({
-                                'id': f"{prescription.id}-{name}-{int(current_time.timestamp())}",
-                                'prescription': prescription.id,
-                                'prescription_title': f"Prescription by {prescription.doctor.profile.name or prescription.doctor.username}",
-                                'medicine_name': name,
-                                'scheduled_time': current_time,
-                                'taken_at': None,
-                                'status': 'pending'
-                            })
-                    current_time += timedelta(hours=interval_hours)
+                name = medicine.name
+                # Jumps straight to the first slot at/after now; nothing before it is enumerated
+                for current_time in schedule.slots_between(now, window_end):
+                    if not is_slot_taken(taken_bitmaps, prescription.id, name, current_time):
+                        pending_doses.append({
+                            'id': f"{prescription.id}-{name}-{int(current_time.timestamp())}",
+                            'prescription': prescription.id,
+                            'prescription_title': prescription_title,
+                            'medicine_name': name,
+                            'scheduled_time': current_time,
+                            'taken_at': None,
+                            'status': 'pending'
+                        })
         
         # Sort by scheduled_time
         pending_doses.sort(key=lambda x: x['scheduled_time'])
         return Response(pending_doses)
 
+    MAX_BATCH_SIZE = 100
+
     def post(self, request):
+        """Mark doses as taken: either a single `log_id`, or a batch via `log_ids` (list)."""
         if not request.user.groups.filter(name='Patient').exists():
             return Response({'error': 'Only patients can access this'}, status=status.HTTP_403_FORBIDDEN)
+        log_ids = request.data.get('log_ids')
+        if log_ids is not None:
+            if not isinstance(log_ids, list) or not log_ids:
+                return Response({'error': 'log_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(log_ids) > self.MAX_BATCH_SIZE:
+                return Response({'error': f'At most {self.MAX_BATCH_SIZE} log_ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+            if not all(self._is_log_id_type(log_id) for log_id in log_ids):
+                return Response({'error': 'log_ids must be strings'}, status=status.HTTP_400_BAD_REQUEST)
+            results = self._mark_taken(request.user, log_ids)
+            return Response({
+                'results': results,
+                'marked': sum(1 for r in results if r['status'] == 'marked'),
+            })
+
         log_id = request.data.get('log_id')
         if not log_id:
             return Response({'error': 'log_id required'}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            # Parse log_id: prescription_id-medicine_name-timestamp
-            parts = log_id.split('-', 2)
-            prescription_id = int(parts[0])
-            medicine_name = parts[1]
-            timestamp = int(parts[2])
-            scheduled_time = datetime.fromtimestamp(timestamp)
-            
-            prescription = Prescription.objects.get(id=prescription_id, patient=request.user)
-            
-            # Check if already taken
-            if TakenDose.objects.filter(
-                prescription=prescription,
-                medicine_name=medicine_name,
-                taken_at__date=scheduled_time.date(),
-                taken_at__hour=scheduled_time.hour
-            ).exists():
-                return Response({'error': 'Already marked'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            TakenDose.objects.create(
-                prescription=prescription,
+        if not self._is_log_id_type(log_id):
+            return Response({'error': 'Invalid log_id'}, status=status.HTTP_400_BAD_REQUEST)
+        result = self._mark_taken(request.user, [log_id])[0]
+        if result['status'] == 'marked':
+            return Response({'message': 'Marked as taken'})
+        if result['status'] == 'already_marked':
+            return Response({'error': 'Already marked'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'error': 'Invalid log_id'}, status=status.HTTP_400_BAD_REQUEST)
+
+    @staticmethod
+    def _is_log_id_type(log_id):
+        return isinstance(log_id, (str, int)) and not isinstance(log_id, bool)
+
+    @staticmethod
+    def _parse_log_id(log_id):
+        """Parse `prescription_id-medicine_name-timestamp` (medicine names may contain dashes)."""
+        prescription_id, rest = str(log_id).split('-', 1)
+        medicine_name, timestamp = rest.rsplit('-', 1)
+        if not medicine_name:
+            raise ValueError('empty medicine name')
+        scheduled_time = datetime.fromtimestamp(int(timestamp), tz=dt_timezone.utc)
+        return int(prescription_id), medicine_name, scheduled_time
+
+    def _mark_taken(self, patient, log_ids):
+        """
+        Validate and record a list of log ids with a constant number of queries.
+
+        Each dose is recorded with `taken_at` = now and `scheduled_time` = the slot it confirms.
+        Returns one `{'log_id', 'status'}` per input, status being 'marked', 'already_marked',
+        'duplicate' (the same slot listed twice) or 'invalid'.
+        """
+        now = timezone.now()
+        parsed = {}
+        for log_id in log_ids:
+            try:
+                parsed[log_id] = self._parse_log_id(log_id)
+            except (ValueError, TypeError, OverflowError, OSError):
+                continue
+
+        # Ownership for every referenced prescription in one query
+        owned = set(
+            Prescription.objects.filter(
+                id__in={prescription_id for prescription_id, _, _ in parsed.values()},
+                patient=patient,
+            ).values_list('id', flat=True)
+        )
+
+        # Slots already confirmed, from the dose bitmaps covering every referenced day
+        taken_bitmaps = {}
+        if parsed:
+            scheduled_times = [scheduled_time for _, _, scheduled_time in parsed.values()]
+            taken_bitmaps = load_bitmaps(owned, min(scheduled_times), max(scheduled_times))
+
+        results = []
+        new_doses = []
+        new_slots = []
+        seen = set()
+        for log_id in log_ids:
+            if log_id not in parsed or parsed[log_id][0] not in owned:
+                results.append({'log_id': log_id, 'status': 'invalid'})
+                continue
+            prescription_id, medicine_name, scheduled_time = parsed[log_id]
+            if is_slot_taken(taken_bitmaps, prescription_id, medicine_name, scheduled_time):
+                results.append({'log_id': log_id, 'status': 'already_marked'})
+                continue
+            key = (prescription_id, medicine_name, scheduled_time)
+            if key in seen:
+                results.append({'log_id': log_id, 'status': 'duplicate'})
+                continue
+            seen.add(key)
+            new_slots.append(key)
+            new_doses.append(TakenDose(
+                prescription_id=prescription_id,
                 medicine_name=medicine_name,
-                taken_at=timezone.now()
+                taken_at=now,
+                scheduled_time=scheduled_time,
+            ))
+            results.append({'log_id': log_id, 'status': 'marked'})
+
+        # unique_together (prescription, medicine_name, scheduled_time) makes concurrent retries harmless,
+        # and setting a bit twice is a no-op
+        with transaction.atomic():
+            TakenDose.objects.bulk_create(new_doses, ignore_conflicts=True)
+            mark_slots_taken(new_slots)
+            if new_doses:
+                # bulk_create sends no post_save
+                notify_reminder_worker()
+        return results
+
+
+class AdherenceReportMixin:
+    """Shared date-range parsing for the adherence report endpoints.
+
+    Query params:
+      start, end (optional, YYYY-MM-DD) -> inclusive range, defaults to the last 30 days, max 366 days.
+    """
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+
+    def adherence_response(self, request, patient):
+        from .adherence import adherence_report
+
+        today = timezone.localdate()
+        try:
+            end = datetime.strptime(request.query_params['end'], '%Y-%m-%d').date() if 'end' in request.query_params else today
+            start = (
+                datetime.strptime(request.query_params['start'], '%Y-%m-%d').date()
+                if 'start' in request.query_params
+                else end - timedelta(days=self.DEFAULT_DAYS - 1)
             )
-            return Response({'message': 'Marked as taken'})
-        except (ValueError, Prescription.DoesNotExist):
-            return Response({'error': 'Invalid log_id'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'start and end must be dates in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days + 1 > self.MAX_DAYS:
+            return Response({'error': f'Date range cannot exceed {self.MAX_DAYS} days'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(adherence_report(patient, start, end))
+
+
+class PatientAdherenceView(AdherenceReportMixin, APIView):
+    """Patient's own taken / late / missed percentages per medicine and per day."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        if not request.user.groups.filter(name='Patient').exists():
+            return Response({'error': 'Only patients can access this'}, status=status.HTTP_403_FORBIDDEN)
+        return self.adherence_response(request, request.user)
+
+
+class DoctorPatientAdherenceView(AdherenceReportMixin, APIView):
+    """Adherence report for one of the doctor's patients."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, patient_id):
+        if not request.user.groups.filter(name='Doctor').exists():
+            return Response({'error': 'Only doctors can access this'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            patient = User.objects.get(id=patient_id, groups__name='Patient')
+            DoctorPatient.objects.get(doctor=request.user, patient=patient)
+        except (User.DoesNotExist, DoctorPatient.DoesNotExist):
+            return Response({'error': 'Patient not found or not associated'}, status=status.HTTP_404_NOT_FOUND)
+        return self.adherence_response(request, patient)
+
+
+class JobRunsView(APIView):
+    """Recent periodic job runs with their counters, newest first (staff only).
+
+    Query params:
+      job (optional) -> only runs of this job (e.g. send_medication_reminders)
+      limit (optional, default 50, max 500)
+    """
+    permission_classes = [IsAdminUser]
+    MAX_LIMIT = 500
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= self.MAX_LIMIT:
+            return Response({'error': f'limit must be between 1 and {self.MAX_LIMIT}'}, status=status.HTTP_400_BAD_REQUEST)
+        runs = JobRun.objects.all()
+        job = request.query_params.get('job')
+        if job:
+            runs = runs.filter(job=job)
+        return Response({
+            # Runs approaching this duration are about to overlap the next tick
+            'tick_seconds': settings.MEDICATION_REMINDER_TICK_SECONDS,
+            'runs': JobRunSerializer(runs[:limit], many=True).data,
+        })
+
+
+class SMSHealthView(APIView):
+    """Circuit breaker state and counters per SMS provider (staff only).
+
+    Breakers are kept per process, so this reports the process that served the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'providers': [get_breaker(provider).snapshot() for provider in ('twilio', 'sns')],
+        })
 
 
 class RequestPasswordResetView(APIView):
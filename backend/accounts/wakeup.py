@@ -0,0 +1,90 @@
+"""
+Early wake-ups for the reminder job.
+
+The reminder worker sleeps until the next dose slot comes due (see `cron.next_reminder_due`).
+When a prescription or taken dose is written, `notify_reminder_worker` wakes it so it can
+recompute that deadline:
+
+- in the same process, through a threading.Event and registered callbacks (APScheduler);
+- across processes on PostgreSQL, through NOTIFY/LISTEN on `CHANNEL`.
+
+Elsewhere (SQLite) other processes only notice on their next capped sleep.
+"""
+from django.db import connections, transaction
+import logging
+import threading
+
+logger = logging.getLogger('accounts.cron')
+
+CHANNEL = 'reminder_worker'
+# Longest a Postgres LISTEN wait blocks before checking for in-process wake-ups again
+POLL_SLICE_SECONDS = 1.0
+
+_event = threading.Event()
+_callbacks = []
+
+
+def add_wakeup_callback(callback):
+    """Call `callback()` (from the writing thread) whenever the reminder worker is notified."""
+    _callbacks.append(callback)
+
+
+def _pg_notify(using):
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"NOTIFY {CHANNEL}")
+    except Exception as e:
+        logger.warning(f"Could not notify reminder worker: {e}")
+
+
+def notify_reminder_worker(using='default'):
+    """Wake the reminder worker once the current transaction commits."""
+    def wake():
+        _event.set()
+        for callback in list(_callbacks):
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Reminder wake-up callback failed: {e}")
+        if connections[using].vendor == 'postgresql':
+            _pg_notify(using)
+
+    transaction.on_commit(wake, using=using)
+
+
+class WakeupListener:
+    """Sleeps for a timeout, returning early when `notify_reminder_worker` fires or `wake()` is called."""
+
+    def __init__(self, using='default'):
+        self._connection = None
+        if connections[using].vendor == 'postgresql':
+            # A dedicated connection: LISTEN must not share the ORM's (possibly recycled) one
+            self._connection = connections.create_connection(using)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+
+    def wake(self):
+        _event.set()
+
+    def wait(self, timeout):
+        """Block up to `timeout` seconds. Returns True if woken early."""
+        if self._connection is None:
+            woken = _event.wait(timeout)
+            _event.clear()
+            return woken
+
+        remaining = timeout
+        while remaining > 0:
+            if _event.is_set():
+                _event.clear()
+                return True
+            slice_seconds = min(remaining, POLL_SLICE_SECONDS)
+            if any(True for _ in self._connection.connection.notifies(timeout=slice_seconds, stop_after=1)):
+                return True
+            remaining -= slice_seconds
+        return False
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
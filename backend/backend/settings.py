@@ -241,6 +241,77 @@ BREVO_API_EMAIL = env("Brevo_API_Email",default='')
 
 CEREBRUS_API_KEY = env("CEREBRUS_API_KEY")
 
+# Medication reminder cron: how long after a scheduled dose we wait before reminding,
+# and how far back a run may catch up after downtime (older unresolved slots are skipped).
+MEDICATION_REMINDER_GRACE_MINUTES = env.int("MEDICATION_REMINDER_GRACE_MINUTES", default=10)
+MEDICATION_REMINDER_CATCHUP_HOURS = env.int("MEDICATION_REMINDER_CATCHUP_HOURS", default=24)
+# Number of due dose slots loaded and matched per query batch
+MEDICATION_REMINDER_BATCH_SIZE = env.int("MEDICATION_REMINDER_BATCH_SIZE", default=500)
+# Expired prescriptions moved to the archive tables per transaction
+PRESCRIPTION_ARCHIVE_BATCH_SIZE = env.int("PRESCRIPTION_ARCHIVE_BATCH_SIZE", default=200)
+# Sent-reminder rows older than this are folded into per-day counts and deleted, in chunks
+MEDICATION_REMINDER_RETENTION_DAYS = env.int("MEDICATION_REMINDER_RETENTION_DAYS", default=30)
+MEDICATION_REMINDER_COMPACT_BATCH_SIZE = env.int("MEDICATION_REMINDER_COMPACT_BATCH_SIZE", default=1000)
+# How long the process running the reminder job holds its lease without renewing; another
+# web/worker process takes over this long after the leader dies
+MEDICATION_REMINDER_LEASE_SECONDS = env.int("MEDICATION_REMINDER_LEASE_SECONDS", default=180)
+# Run the reminder job on a scheduler thread inside the web processes. Set to False when
+# `manage.py run_reminder_worker` runs as its own process (or CronJob with --once).
+MEDICATION_REMINDER_IN_PROCESS_SCHEDULER = env.bool("MEDICATION_REMINDER_IN_PROCESS_SCHEDULER", default=True)
+# Longest the reminder job sleeps; it otherwise wakes when the next dose slot is due or when
+# a prescription / taken dose is written (cross-process wake-ups need PostgreSQL NOTIFY)
+MEDICATION_REMINDER_TICK_SECONDS = env.int("MEDICATION_REMINDER_TICK_SECONDS", default=60)
+# Reminder outbox dispatcher: parallel SMS sends, rows claimed per batch, how often an idle
+# dispatcher polls, retries before a row is marked failed, and when a claim by a crashed
+# dispatcher may be taken over
+REMINDER_DISPATCH_CONCURRENCY = env.int("REMINDER_DISPATCH_CONCURRENCY", default=4)
+REMINDER_DISPATCH_BATCH_SIZE = env.int("REMINDER_DISPATCH_BATCH_SIZE", default=100)
+REMINDER_DISPATCH_TICK_SECONDS = env.int("REMINDER_DISPATCH_TICK_SECONDS", default=5)
+REMINDER_DISPATCH_MAX_ATTEMPTS = env.int("REMINDER_DISPATCH_MAX_ATTEMPTS", default=5)
+REMINDER_DISPATCH_CLAIM_TIMEOUT_SECONDS = env.int("REMINDER_DISPATCH_CLAIM_TIMEOUT_SECONDS", default=300)
+# Long-lived SMS provider clients (accounts.sms_clients): keep-alive connections per provider,
+# sized for the dispatcher's parallel sends, and the per-request timeout
+SMS_CLIENT_POOL_SIZE = env.int("SMS_CLIENT_POOL_SIZE", default=REMINDER_DISPATCH_CONCURRENCY)
+SMS_CLIENT_TIMEOUT_SECONDS = env.int("SMS_CLIENT_TIMEOUT_SECONDS", default=10)
+# SMS provider circuit breakers (accounts.circuit_breaker): over the last WINDOW calls (once
+# at least MIN_CALLS were made), a failure ratio >= FAILURE_RATE opens the breaker; calls slower
+# than SLOW_CALL_SECONDS count as failures. An open provider is skipped for OPEN_SECONDS, then
+# HALF_OPEN_PROBES trial calls decide whether it closes again.
+SMS_BREAKER_WINDOW = env.int("SMS_BREAKER_WINDOW", default=20)
+SMS_BREAKER_MIN_CALLS = env.int("SMS_BREAKER_MIN_CALLS", default=5)
+SMS_BREAKER_FAILURE_RATE = env.float("SMS_BREAKER_FAILURE_RATE", default=0.5)
+SMS_BREAKER_SLOW_CALL_SECONDS = env.float("SMS_BREAKER_SLOW_CALL_SECONDS", default=5.0)
+SMS_BREAKER_OPEN_SECONDS = env.float("SMS_BREAKER_OPEN_SECONDS", default=30.0)
+SMS_BREAKER_HALF_OPEN_PROBES = env.int("SMS_BREAKER_HALF_OPEN_PROBES", default=1)
+# Messages per second each SMS provider accepts from this process (token buckets in
+# accounts.rate_limit), and the longest a send waits for its turn before giving up
+SMS_RATE_LIMITS = {
+    'twilio': env.float("SMS_TWILIO_RATE_PER_SECOND", default=10.0),
+    'sns': env.float("SMS_SNS_RATE_PER_SECOND", default=20.0),
+}
+SMS_RATE_LIMIT_MAX_WAIT_SECONDS = env.float("SMS_RATE_LIMIT_MAX_WAIT_SECONDS", default=30.0)
+# Reminders for the same phone queued within this many seconds go out as one SMS (0: only
+# those queued by the same scan), split so no message exceeds SMS_MAX_SEGMENTS
+REMINDER_COALESCE_WINDOW_SECONDS = env.int("REMINDER_COALESCE_WINDOW_SECONDS", default=0)
+# Longest SMS we send, in billable segments (153 GSM-7 / 67 UCS-2 characters each once a
+# message is split); longer texts go out as up to SMS_MAX_PARTS numbered messages, the
+# last one truncated if even that is not enough (accounts.sms_encoding)
+SMS_MAX_SEGMENTS = env.int("SMS_MAX_SEGMENTS", default=3)
+SMS_MAX_PARTS = env.int("SMS_MAX_PARTS", default=5)
+# JobRun rows (per-run stats of periodic jobs) kept per job; older ones are pruned after each run
+JOB_RUN_HISTORY_PER_JOB = env.int("JOB_RUN_HISTORY_PER_JOB", default=1000)
+
+# Notification backends, by dotted path (like EMAIL_BACKEND). For load tests and offline
+# development use accounts.notification_backends.LocMemSMSBackend / FileSMSBackend and
+# LocMemEmailBackend / FileEmailBackend instead of the real providers.
+SMS_BACKEND = env("SMS_BACKEND", default='accounts.notification_backends.ProviderSMSBackend')
+NOTIFICATION_EMAIL_BACKEND = env("NOTIFICATION_EMAIL_BACKEND", default='accounts.notification_backends.BrevoEmailBackend')
+# Simulated provider latency and failure ratio (0..1) applied by the stand-in backends
+NOTIFICATION_STANDIN_LATENCY_MS = env.int("NOTIFICATION_STANDIN_LATENCY_MS", default=0)
+NOTIFICATION_STANDIN_FAILURE_RATE = env.float("NOTIFICATION_STANDIN_FAILURE_RATE", default=0.0)
+# JSON-lines file the File*Backend stand-ins append to
+NOTIFICATION_FILE_PATH = env("NOTIFICATION_FILE_PATH", default=str(BASE_DIR / 'logs/notifications.jsonl'))
+
 # CRONJOBS = [
 #     ('*/20 * * * *', 'accounts.cron.send_medication_reminders'),
-# ]
\ No newline at end of file
+# ]